@@ -1,14 +1,22 @@
+import asyncio
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 from calendar_service import CalendarService
+from collections import Counter
 import re
 from dateutil import parser
 from config import config
 from typing_extensions import TypedDict
+from pydantic import BaseModel, Field
 from smart_features import SmartFeatures
+from intent_cache import IntentCache
+from extractors import duration_minutes, extract_entities
+from history import MessageWindow, roll_summary
+from metrics import FALLBACKS, LLM_LATENCY, NODE_LATENCY
+from slots import Slot
 
 class BookingState(TypedDict):
     messages: List
@@ -16,31 +24,90 @@ class BookingState(TypedDict):
     date_preference: Optional[str]
     time_preference: Optional[str]
     duration: int
-    available_slots: List[Dict]
-    selected_slot: Optional[Dict]
+    available_slots: List[Slot]
+    selected_slot: Optional[Slot]
     booking_confirmed: bool
     user_name: Optional[str]
+    slot_choice: Optional[int]
+    meeting_type: Optional[str]
+    urgency: Optional[str]
+    history_summary: str
+    last_reply: Optional[str]
+    intent_path: Optional[str]
+
+class TurnAnalysis(BaseModel):
+    """Structured reading of a turn taken while slots are on offer"""
+    intent: str = Field(description="One of book, check_availability, confirm, select_slot, casual_chat, reschedule")
+    date: Optional[str] = Field(None, description="Date preference: a specific date, relative like 'tomorrow', or none")
+    time: Optional[str] = Field(None, description="Time preference: a specific time, relative like 'afternoon', or none")
+    meeting_type: Optional[str] = Field(None, description="call, meeting, appointment, or none")
+    duration: Optional[str] = Field(None, description="Duration if mentioned, e.g. '30min'")
+    urgency: Optional[str] = Field(None, description="urgent, flexible, or normal")
+    slot_number: int = Field(0, description="Number of the offered slot the user picked, or 0 if they did not pick one")
+
+# Keyword groups for rule-based intent scoring, matched against whole words
+INTENT_KEYWORDS = [
+    ('book', {'book', 'schedule', 'appointment', 'meeting', 'call'}),
+    ('check_availability', {'available', 'free', 'slots', 'time'}),
+    ('confirm', {'yes', 'confirm', 'ok', 'sure'})
+]
+AMBIGUOUS_WORDS = {'reschedule', 'cancel', 'instead', 'actually', "don't", 'not', 'maybe', 'or', 'but'}
+URGENT_WORDS = {'urgent', 'urgently', 'asap', 'immediately'}
+# Slots shown per availability reply, picked by slot_ranking from the whole window
+OFFERED_SLOTS = 5
+WORD_PATTERN = re.compile(r"[a-z']+")
+SLOT_ORDINALS = {'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5}
+SLOT_REFERENCE = re.compile(r'^(?:the\s+)?(?:slot\s*|option\s*|number\s*)?(?:[1-9]|first|second|third|fourth|fifth)(?:\s+(?:one|slot|option|please))?$')
+
+# User-facing progress labels for streamed turns
+NODE_PROGRESS = {
+    "understand_intent": "Understanding your request...",
+    "check_availability": "Checking availability...",
+    "suggest_slots": "Picking the best times...",
+    "confirm_booking": "Confirming your selection...",
+    "book_appointment": "Booking your appointment..."
+}
+
+# Shared work for the turns of one aprocess_batch call: a fixed clock, model
+# answers fetched up front and in-flight calendar lookups
+BATCH_SCOPE: ContextVar[Optional[Dict]] = ContextVar("booking_batch_scope", default=None)
 
 class BookingAgent:
-    def __init__(self):
-        self.calendar_service = CalendarService()
-        self.llm = ChatOpenAI(
-            api_key=config.OPENAI_API_KEY,
-            model="gpt-3.5-turbo",
-            temperature=0.8
-        ) if config.OPENAI_API_KEY else None
+    def __init__(self, calendar_service: Optional[CalendarService] = None, llm=None):
+        """Pass calendar_service or llm to use them instead of Google Calendar and OpenAI"""
+        self.calendar_service = calendar_service if calendar_service is not None else CalendarService()
+        if llm is None and config.OPENAI_API_KEY:
+            # Imported here: langchain_openai is the slowest import in the app
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(
+                api_key=config.OPENAI_API_KEY,
+                base_url=config.OPENAI_BASE_URL,
+                model="gpt-3.5-turbo",
+                temperature=0.8
+            )
+        self.llm = llm
+        self.turn_llm = self.llm.with_structured_output(TurnAnalysis, method="function_calling") if self.llm else None
+        self.intent_cache = IntentCache(
+            max_entries=config.INTENT_CACHE_SIZE,
+            ttl_seconds=config.INTENT_CACHE_TTL_SECONDS,
+            path=config.INTENT_CACHE_PATH
+        )
         self.graph = self._build_graph()
+        self.intent_paths = Counter({'rule': 0, 'cache': 0, 'llm': 0, 'fallback': 0})
         self.user_preferences = {}  # Store user preferences
         self.conversation_context = {}  # Track conversation flow
     
     def _build_graph(self):
+        from langgraph.graph import StateGraph, END
+        
         workflow = StateGraph(BookingState)
         
-        workflow.add_node("understand_intent", self._understand_intent)
-        workflow.add_node("check_availability", self._check_availability)
-        workflow.add_node("suggest_slots", self._suggest_slots)
-        workflow.add_node("confirm_booking", self._confirm_booking)
-        workflow.add_node("book_appointment", self._book_appointment)
+        # Nodes doing I/O carry an async twin so the same graph serves invoke and ainvoke
+        workflow.add_node("understand_intent", self._timed_node("understand_intent", self._understand_intent, self._aunderstand_intent))
+        workflow.add_node("check_availability", self._timed_node("check_availability", self._check_availability, self._acheck_availability))
+        workflow.add_node("suggest_slots", self._timed_node("suggest_slots", self._suggest_slots))
+        workflow.add_node("confirm_booking", self._timed_node("confirm_booking", self._confirm_booking, self._aconfirm_booking))
+        workflow.add_node("book_appointment", self._timed_node("book_appointment", self._book_appointment, self._abook_appointment))
         
         workflow.set_entry_point("understand_intent")
         
@@ -61,26 +128,184 @@ class BookingAgent:
         
         return workflow.compile()
     
+    def _timed_node(self, name: str, func, afunc=None):
+        """Wrap a node (and its async twin) to record its latency under name"""
+        def run(state: Dict) -> Dict:
+            with NODE_LATENCY.time(node=name):
+                return func(state)
+        
+        if afunc is None:
+            return run
+        
+        async def arun(state: Dict) -> Dict:
+            with NODE_LATENCY.time(node=name):
+                return await afunc(state)
+        
+        return RunnableLambda(run, afunc=arun)
+    
     def _understand_intent(self, state: Dict) -> Dict:
         """Advanced intent understanding with context awareness"""
         if not state.get('messages', []):
             return state
         
+        user_input = self._prepare_intent(state)
+        request = self._resolve_intent(state, user_input)
+        if request is not None:
+            model, prompt, cache_key = request
+            try:
+                with LLM_LATENCY.time(call='turn' if model is self.turn_llm else 'intent'):
+                    answer = model.invoke(prompt)
+                self._apply_model_answer(state, answer, cache_key)
+            except:
+                self._intent_fallback(state, user_input)
+        
+        return state
+    
+    async def _aunderstand_intent(self, state: Dict) -> Dict:
+        """Async variant of _understand_intent"""
+        if not state.get('messages', []):
+            return state
+        
+        user_input = self._prepare_intent(state)
+        request = self._resolve_intent(state, user_input)
+        if request is not None:
+            model, prompt, cache_key = request
+            try:
+                answer = await self._ainvoke_model(model, prompt)
+                self._apply_model_answer(state, answer, cache_key)
+            except:
+                self._intent_fallback(state, user_input)
+        
+        return state
+    
+    def _resolve_intent(self, state: Dict, user_input: str) -> Optional[tuple]:
+        """Settle the intent from rules or the cache where possible.
+        
+        Returns the (model, prompt, cache_key) still to be asked, or None once
+        the intent is in state. cache_key is None for the structured turn call.
+        """
+        # Confident rule-based answers skip the model entirely
+        fields, confidence = self._score_intent(state, user_input.lower())
+        if confidence >= config.INTENT_FAST_PATH_THRESHOLD:
+            self._record_intent_path(state, 'rule')
+            self._apply_intent(state, fields)
+            if fields[0] == 'select_slot':
+                state['slot_choice'] = self._slot_reference(user_input)
+            return None
+        
+        request = self._model_request(state, user_input)
+        if request is None:
+            self._record_intent_path(state, 'fallback')
+            self._basic_intent_extraction(state, user_input.lower())
+            return None
+        
+        cache_key = request[2]
+        fields = self.intent_cache.get(cache_key) if cache_key else None
+        if fields is not None:
+            self._record_intent_path(state, 'cache')
+            self._apply_intent(state, fields)
+            return None
+        return request
+    
+    def _model_request(self, state: Dict, user_input: str) -> Optional[tuple]:
+        """The (model, prompt, cache_key) that reads a turn the rules can't, or None without a model"""
+        if not self.llm:
+            return None
+        if state.get('available_slots') and not state.get('selected_slot'):
+            # Slots are on offer: one structured call reads the intent and the chosen slot
+            return self.turn_llm, self._turn_prompt(state, user_input), None
+        return self.llm, self._intent_prompt(state, user_input), self.intent_cache.make_key(user_input, self._recent_history(state))
+    
+    def _apply_model_answer(self, state: Dict, answer, cache_key: Optional[str]):
+        """Store the model's reading of a turn, caching plain intent answers"""
+        if cache_key is None:
+            self._apply_turn_analysis(state, answer)
+        else:
+            fields = self._parse_intent_response(answer.content.strip())
+            self.intent_cache.put(cache_key, fields)
+            self._apply_intent(state, fields)
+        self._record_intent_path(state, 'llm')
+    
+    def _intent_fallback(self, state: Dict, user_input: str):
+        """Fall back to keyword extraction after a failed model call"""
+        self._record_intent_path(state, 'fallback')
+        FALLBACKS.inc(site='understand_intent')
+        self._basic_intent_extraction(state, user_input.lower())
+    
+    def _prepare_intent(self, state: Dict) -> str:
+        """Return the latest user input, picking up their name if they gave it"""
         last_message = state['messages'][-1]
         user_input = last_message.content
+        state['slot_choice'] = None
+        state['intent_path'] = None
         
         # Extract user name if mentioned
-        if 'my name is' in user_input.lower() or 'i\'m ' in user_input.lower():
-            import re
-            name_match = re.search(r'(?:my name is|i\'m|call me)\s+([a-zA-Z]+)', user_input.lower())
-            if name_match:
-                state['user_name'] = name_match.group(1).title()
-        
-        if self.llm:
-            # Enhanced prompt with context
-            conversation_history = "\n".join([f"User: {msg.content}" if hasattr(msg, 'content') and not isinstance(msg, AIMessage) else f"Assistant: {msg.content}" for msg in state.get('messages', [])[-3:]])
-            
-            prompt = f"""You are an AI scheduling assistant. Analyze this conversation:
+        user_name = extract_entities(user_input).name
+        if user_name:
+            state['user_name'] = user_name
+        
+        return user_input
+    
+    async def _ainvoke_model(self, model, prompt: str):
+        """Answer from the current batch's prefetched results, or call the model"""
+        scope = BATCH_SCOPE.get()
+        key = (model is self.turn_llm, prompt)
+        if scope is not None and key in scope['answers']:
+            answer = scope['answers'][key]
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+        with LLM_LATENCY.time(call='turn' if model is self.turn_llm else 'intent'):
+            return await model.ainvoke(prompt)
+    
+    def _pending_model_call(self, state: Dict) -> Optional[tuple]:
+        """The (model, prompt) understand_intent would send for this turn, or None if it needs no model call"""
+        if not self.llm or not state.get('messages'):
+            return None
+        user_input = state['messages'][-1].content
+        _, confidence = self._score_intent(state, user_input.lower())
+        if confidence >= config.INTENT_FAST_PATH_THRESHOLD:
+            return None
+        model, prompt, cache_key = self._model_request(state, user_input)
+        if cache_key is not None and cache_key in self.intent_cache:
+            return None
+        return model, prompt
+    
+    async def _aprefetch_answers(self, states: List[Dict]) -> Dict:
+        """Send every turn's intent prompt in one abatch per model, deduplicating identical prompts"""
+        prompts = {}
+        for state in states:
+            call = self._pending_model_call(state)
+            if call:
+                model, prompt = call
+                prompts.setdefault(model is self.turn_llm, {})[prompt] = model
+        
+        async def run_group(structured: bool, group: Dict) -> List:
+            model = self.turn_llm if structured else self.llm
+            batch_prompts = list(group)
+            with LLM_LATENCY.time(call='turn_batch' if structured else 'intent_batch'):
+                results = await model.abatch(batch_prompts, return_exceptions=True)
+            return [((structured, prompt), result) for prompt, result in zip(batch_prompts, results)]
+        
+        groups = await asyncio.gather(*(run_group(structured, group) for structured, group in prompts.items()))
+        return dict(pair for group in groups for pair in group)
+    
+    def _recent_history(self, state: Dict) -> List[tuple]:
+        """The (role, content) window of recent messages shown to the model"""
+        return [("Assistant", msg.content) if isinstance(msg, AIMessage) else ("User", msg.content) for msg in state.get('messages', [])[-3:]]
+    
+    def _conversation_context(self, state: Dict) -> str:
+        """Summary of turns that left the history window, then the recent messages"""
+        conversation_history = "\n".join([f"{role}: {content}" for role, content in self._recent_history(state)])
+        if state.get('history_summary'):
+            return f"Earlier in the conversation:\n{state['history_summary']}\n\nRecent messages:\n{conversation_history}"
+        return conversation_history
+    
+    def _intent_prompt(self, state: Dict, user_input: str) -> str:
+        """Build the intent extraction prompt with recent conversation context"""
+        conversation_history = self._conversation_context(state)
+        
+        return f"""You are an AI scheduling assistant. Analyze this conversation:
 
 {conversation_history}
 
@@ -96,35 +321,143 @@ Extract:
 
 Format: intent|date|time|type|duration|urgency
 Example: book|next friday|2pm|call|30min|normal"""
-            
-            try:
-                response = self.llm.invoke(prompt).content.strip()
-                parts = response.split('|')
-                state['intent'] = parts[0] if len(parts) > 0 else 'book'
-                state['date_preference'] = parts[1] if len(parts) > 1 and parts[1] not in ['none', ''] else None
-                state['time_preference'] = parts[2] if len(parts) > 2 and parts[2] not in ['none', ''] else None
-                state['meeting_type'] = parts[3] if len(parts) > 3 and parts[3] not in ['none', ''] else 'meeting'
-                state['duration'] = self._parse_duration(parts[4]) if len(parts) > 4 and parts[4] not in ['none', ''] else 60
-                state['urgency'] = parts[5] if len(parts) > 5 and parts[5] not in ['none', ''] else 'normal'
-            except:
-                self._basic_intent_extraction(state, user_input.lower())
-        else:
-            self._basic_intent_extraction(state, user_input.lower())
+    
+    def _turn_prompt(self, state: Dict, user_input: str) -> str:
+        """Prompt for the combined intent and slot selection call"""
+        conversation_history = self._conversation_context(state)
+        slots_info = "\n".join([f"{i+1}. {slot.start.strftime('%A, %B %d at %I:%M %p')}" for i, slot in enumerate(state['available_slots'])])
         
-        return state
+        return f"""You are an AI scheduling assistant. Analyze this conversation:
+
+{conversation_history}
+
+Latest message: "{user_input}"
+
+The user has been offered these slots:
+{slots_info}
+
+Extract the intent, date and time preferences, meeting type, duration and urgency, and which slot number (1-{len(state['available_slots'])}) the user selected, or 0 if they did not select one."""
+    
+    def _apply_turn_analysis(self, state: Dict, analysis: TurnAnalysis):
+        """Store a structured turn analysis in state"""
+        def given(value):
+            return None if value in (None, '', 'none') else value
+        
+        self._apply_intent(state, (
+            given(analysis.intent) or 'book',
+            given(analysis.date),
+            given(analysis.time),
+            given(analysis.meeting_type) or 'meeting',
+            # Offered slots already have a length; only change it when asked to
+            self._parse_duration(analysis.duration) if given(analysis.duration) else state.get('duration', 60),
+            given(analysis.urgency) or 'normal'
+        ))
+        state['slot_choice'] = analysis.slot_number
+    
+    def _parse_intent_response(self, response: str) -> tuple:
+        """Parse a pipe-delimited intent response into (intent, date, time, type, duration, urgency)"""
+        parts = response.split('|')
+        return (
+            parts[0] if len(parts) > 0 else 'book',
+            parts[1] if len(parts) > 1 and parts[1] not in ['none', ''] else None,
+            parts[2] if len(parts) > 2 and parts[2] not in ['none', ''] else None,
+            parts[3] if len(parts) > 3 and parts[3] not in ['none', ''] else 'meeting',
+            self._parse_duration(parts[4]) if len(parts) > 4 and parts[4] not in ['none', ''] else 60,
+            parts[5] if len(parts) > 5 and parts[5] not in ['none', ''] else 'normal'
+        )
+    
+    def _apply_intent(self, state: Dict, fields: tuple):
+        """Store parsed intent fields in state"""
+        (state['intent'], state['date_preference'], state['time_preference'],
+         state['meeting_type'], state['duration'], state['urgency']) = fields
     
     def _parse_duration(self, duration_str: str) -> int:
         """Parse duration string to minutes"""
-        if not duration_str:
-            return 60
-        import re
-        if 'hour' in duration_str:
-            hours = re.findall(r'(\d+)', duration_str)
-            return int(hours[0]) * 60 if hours else 60
-        elif 'min' in duration_str:
-            mins = re.findall(r'(\d+)', duration_str)
-            return int(mins[0]) if mins else 60
-        return 60
+        minutes = duration_minutes(duration_str) if duration_str else None
+        return minutes if minutes is not None else 60
+    
+    def _score_intent(self, state: Dict, user_input: str) -> tuple:
+        """Rule-based intent fields plus a 0-1 confidence that they match what the LLM would say"""
+        # A bare slot reference while slots are on offer is unambiguous
+        if state.get('available_slots') and SLOT_REFERENCE.match(user_input.strip()):
+            fields = ('select_slot', state.get('date_preference'), state.get('time_preference'),
+                      state.get('meeting_type', 'meeting'), state.get('duration', 60), state.get('urgency', 'normal'))
+            return fields, 0.95
+        
+        tokens = set(WORD_PATTERN.findall(user_input))
+        if user_input.strip(' .!') == 'book it':
+            # A bare "book it" confirms the offer on the table rather than starting a new booking
+            tokens.discard('book')
+            tokens.add('confirm')
+        groups = [intent for intent, keywords in INTENT_KEYWORDS if tokens & keywords]
+        intent = groups[0] if groups else 'book'
+        entities = extract_entities(user_input)
+        date_pref = entities.date
+        time_pref = entities.time
+        duration = duration_minutes(entities.duration) if entities.duration else None
+        meeting_type = next((kind for kind in ('call', 'appointment', 'meeting') if kind in tokens), None)
+        urgent = bool(tokens & URGENT_WORDS)
+        # Hedging, negation and corrections need the model's judgement
+        ambiguous = bool(tokens & AMBIGUOUS_WORDS) or '?' in user_input or 'what about' in user_input
+        
+        if len(groups) == 1:
+            confidence = 0.55
+        elif groups:
+            confidence = 0.25
+        else:
+            confidence = 0.0
+        if (intent == 'confirm' and len(groups) == 1 and len(user_input.split()) <= 4 and not ambiguous
+                and not (date_pref or time_pref or entities.duration)):
+            # A bare "yes" accepts the current offer, so keep its preferences
+            fields = ('confirm', state.get('date_preference'), state.get('time_preference'),
+                      state.get('meeting_type', 'meeting'), state.get('duration', 60), state.get('urgency', 'normal'))
+            return fields, 0.9
+        confidence += 0.2 if date_pref else 0.0
+        confidence += 0.15 if time_pref else 0.0
+        if entities.duration:
+            # A duration the rules can't read exactly is left to the model
+            confidence += 0.1 if duration else -0.3
+        confidence += 0.05 if meeting_type else 0.0
+        
+        if ambiguous:
+            confidence -= 0.3
+        if len(user_input.split()) > 20:
+            confidence -= 0.2
+        
+        fields = (
+            intent,
+            date_pref,
+            time_pref,
+            meeting_type or 'meeting',
+            duration or 60,
+            'urgent' if urgent else 'normal'
+        )
+        return fields, max(0.0, min(confidence, 1.0))
+    
+    def _slot_reference(self, user_input: str) -> int:
+        """Offered slot number named by a bare reference like "2" or "the second one", or 0"""
+        number = extract_entities(user_input).slot_number
+        if number is not None:
+            return number
+        return next((number for word, number in SLOT_ORDINALS.items() if word in user_input.lower()), 0)
+    
+    def _record_intent_path(self, state: Dict, path: str):
+        """Count how a turn's intent was resolved and remember it for the rest of the turn"""
+        self.intent_paths[path] += 1
+        state['intent_path'] = path
+    
+    def _record_slot_call(self, state: Dict):
+        """A slot selection model call means a rule or cache turn reached the model after all"""
+        path = state.get('intent_path')
+        if path in ('rule', 'cache'):
+            self.intent_paths[path] -= 1
+            self._record_intent_path(state, 'llm')
+    
+    def intent_path_stats(self) -> Dict[str, Any]:
+        """How turns were resolved, and the share that never reached the model"""
+        total = sum(self.intent_paths.values())
+        avoided = self.intent_paths['rule'] + self.intent_paths['cache']
+        return dict(self.intent_paths, model_avoided_fraction=round(avoided / total, 3) if total else 0.0)
     
     def _basic_intent_extraction(self, state: Dict, user_input: str):
         """Fallback intent extraction"""
@@ -142,41 +475,19 @@ Example: book|next friday|2pm|call|30min|normal"""
     
     def _extract_date_info(self, text: str) -> Optional[str]:
         """Extract date information from text"""
-        date_patterns = [
-            r'tomorrow',
-            r'today',
-            r'next week',
-            r'this week',
-            r'monday|tuesday|wednesday|thursday|friday|saturday|sunday',
-            r'\d{1,2}[/-]\d{1,2}',
-            r'next \w+day'
-        ]
-        
-        for pattern in date_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return re.search(pattern, text, re.IGNORECASE).group()
-        return None
+        return extract_entities(text).date
     
     def _extract_time_info(self, text: str) -> Optional[str]:
         """Extract time information from text"""
-        time_patterns = [
-            r'\d{1,2}:\d{2}\s*(am|pm)?',
-            r'\d{1,2}\s*(am|pm)',
-            r'morning|afternoon|evening',
-            r'between\s+\d+.*\d+',
-            r'\d+-\d+\s*pm'
-        ]
-        
-        for pattern in time_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group()
-        return None
+        return extract_entities(text).time
     
     def _route_after_intent(self, state: Dict) -> str:
         """Route based on understood intent"""
         # If we have available slots and user is selecting, go to confirm
         if state.get('available_slots') and not state.get('selected_slot'):
+            # The structured call or the rules already recognised a selection
+            if state.get('slot_choice') or state.get('intent') == 'select_slot':
+                return "confirm"
             messages = state.get('messages', [])
             if messages:
                 last_msg = messages[-1].content.lower()
@@ -184,7 +495,8 @@ Example: book|next friday|2pm|call|30min|normal"""
                 if any(word in last_msg for word in ['1', '2', '3', '4', '5', 'pm', 'am', 'first', 'second']):
                     return "confirm"
         
-        if state.get('intent') == 'confirm' and state.get('selected_slot'):
+        # A confirmed booking leaves no open offer; saying "yes" again must not book it twice
+        if state.get('intent') == 'confirm' and state.get('selected_slot') and not state.get('booking_confirmed'):
             return "confirm"
         elif state.get('intent') in ['book', 'check_availability']:
             return "check_availability"
@@ -194,12 +506,40 @@ Example: book|next friday|2pm|call|30min|normal"""
     def _check_availability(self, state: Dict) -> Dict:
         """Check calendar availability"""
         start_date, end_date = self._parse_date_range(state.get('date_preference'))
-        state['available_slots'] = self.calendar_service.get_free_slots(start_date, end_date, state.get('duration', 60))
+        state['available_slots'] = self.calendar_service.get_ranked_free_slots(
+            start_date, end_date, state.get('duration', 60), OFFERED_SLOTS,
+            state.get('time_preference'), state.get('urgency') == 'urgent', self._attendee_calendars())
+        return state
+    
+    async def _acheck_availability(self, state: Dict) -> Dict:
+        """Async variant of _check_availability"""
+        start_date, end_date = self._parse_date_range(state.get('date_preference'))
+        # Turns of one batch asking for the same window and preferences share a single lookup
+        key = (start_date, end_date, state.get('duration', 60), OFFERED_SLOTS,
+               state.get('time_preference'), state.get('urgency') == 'urgent', self._attendee_calendars())
+        scope = BATCH_SCOPE.get()
+        if scope is None:
+            state['available_slots'] = await self.calendar_service.aget_ranked_free_slots(*key)
+            return state
+        
+        lookup = scope['lookups'].get(key)
+        if lookup is None:
+            lookup = scope['lookups'][key] = asyncio.ensure_future(
+                self.calendar_service.aget_ranked_free_slots(*key))
+        state['available_slots'] = list(await lookup)
         return state
     
+    def _attendee_calendars(self) -> Optional[Tuple[str, ...]]:
+        """Calendars that must all be free for an offered slot, or None when only ours counts"""
+        if not config.ATTENDEE_CALENDAR_IDS:
+            return None
+        return (config.CALENDAR_ID,) + tuple(calendar_id for calendar_id in config.ATTENDEE_CALENDAR_IDS
+                                             if calendar_id != config.CALENDAR_ID)
+    
     def _parse_date_range(self, date_pref: Optional[str]) -> tuple:
         """Parse date preference into start and end datetime"""
-        now = datetime.now()
+        scope = BATCH_SCOPE.get()
+        now = scope['now'] if scope is not None else datetime.now()
         
         if not date_pref:
             start_date = now + timedelta(days=1)
@@ -221,13 +561,16 @@ Example: book|next friday|2pm|call|30min|normal"""
     
     def _suggest_slots(self, state: Dict) -> Dict:
         """Smart slot suggestions with personalization"""
+        # A fresh offer opens a new booking: nothing is selected or confirmed yet
+        state['selected_slot'] = None
+        state['booking_confirmed'] = False
         if not state.get('available_slots', []):
             user_name = state.get('user_name', '')
             name_part = f"{user_name}, " if user_name else ""
             response = f"Sorry {name_part}I don't see any available slots for that time. How about we try a different day? What works better for your schedule?"
         else:
             # Smart filtering based on preferences
-            slots = state['available_slots'][:5]
+            slots = state['available_slots'][:OFFERED_SLOTS]
             urgency = state.get('urgency', 'normal')
             meeting_type = state.get('meeting_type', 'meeting')
             duration = state.get('duration', 60)
@@ -238,7 +581,7 @@ Example: book|next friday|2pm|call|30min|normal"""
             
             slots_text = []
             for i, slot in enumerate(slots, 1):
-                start_time = slot['start']
+                start_time = slot.start
                 time_str = start_time.strftime("%A, %B %d at %I:%M %p")
                 
                 # Add helpful context
@@ -275,51 +618,96 @@ Example: book|next friday|2pm|call|30min|normal"""
             else:
                 response += "\n\nWhich one fits best with your schedule? Just let me know!"
         
-        if 'messages' not in state:
-            state['messages'] = []
-        state['messages'].append(AIMessage(content=response))
+        self._add_reply(state, response)
         return state
     
     def _confirm_booking(self, state: Dict) -> Dict:
         """Confirm booking with natural selection"""
+        request = self._resolve_slot(state)
+        if request is not None:
+            user_input, available_slots = request
+            # Use OpenAI to understand slot selection
+            try:
+                with LLM_LATENCY.time(call='slot'):
+                    response = self.llm.invoke(self._slot_prompt(user_input, available_slots)).content.strip()
+                self._apply_slot_response(state, response, available_slots)
+            except:
+                self._slot_fallback(state, user_input, available_slots)
+        
+        return self._confirm_response(state)
+    
+    async def _aconfirm_booking(self, state: Dict) -> Dict:
+        """Async variant of _confirm_booking"""
+        request = self._resolve_slot(state)
+        if request is not None:
+            user_input, available_slots = request
+            try:
+                with LLM_LATENCY.time(call='slot'):
+                    response = (await self.llm.ainvoke(self._slot_prompt(user_input, available_slots))).content.strip()
+                self._apply_slot_response(state, response, available_slots)
+            except:
+                self._slot_fallback(state, user_input, available_slots)
+        
+        return self._confirm_response(state)
+    
+    def _resolve_slot(self, state: Dict) -> Optional[tuple]:
+        """Select the slot without the model where possible, else return the (user_input, slots) to ask it about"""
         messages = state.get('messages', [])
         last_message = messages[-1] if messages else None
+        if not (last_message and hasattr(last_message, 'content')):
+            return None
         
-        if last_message and hasattr(last_message, 'content'):
-            user_input = last_message.content
-            available_slots = state.get('available_slots', [])
-            
-            if self.llm and available_slots:
-                # Use OpenAI to understand slot selection
-                slots_info = "\n".join([f"{i+1}. {slot['start'].strftime('%A, %B %d at %I:%M %p')}" for i, slot in enumerate(available_slots)])
-                prompt = f"""User said: "{user_input}"
+        user_input = last_message.content
+        available_slots = state.get('available_slots', [])
+        if state.get('slot_choice') is not None:
+            # Already answered by the structured call or the rules in understand_intent
+            self._apply_slot_choice(state, state['slot_choice'], user_input, available_slots)
+        elif self.llm and available_slots:
+            self._record_slot_call(state)
+            return user_input, available_slots
+        else:
+            self._basic_slot_extraction(state, user_input, available_slots)
+        return None
+    
+    def _slot_fallback(self, state: Dict, user_input: str, available_slots: List):
+        """Fall back to basic extraction after a failed slot selection call"""
+        FALLBACKS.inc(site='confirm_booking')
+        self._basic_slot_extraction(state, user_input, available_slots)
+    
+    def _slot_prompt(self, user_input: str, available_slots: List) -> str:
+        """Build the slot selection prompt"""
+        slots_info = "\n".join([f"{i+1}. {slot.start.strftime('%A, %B %d at %I:%M %p')}" for i, slot in enumerate(available_slots)])
+        return f"""User said: "{user_input}"
 
 Available slots:
 {slots_info}
 
 Which slot number (1-{len(available_slots)}) did they select? Respond with just the number, or 0 if unclear."""
-                
-                try:
-                    response = self.llm.invoke(prompt).content.strip()
-                    slot_num = int(response)
-                    if 1 <= slot_num <= len(available_slots):
-                        state['selected_slot'] = available_slots[slot_num - 1]
-                except:
-                    # Fallback to basic extraction
-                    self._basic_slot_extraction(state, user_input, available_slots)
-            else:
-                self._basic_slot_extraction(state, user_input, available_slots)
-        
+    
+    def _apply_slot_choice(self, state: Dict, slot_num: int, user_input: str, available_slots: List):
+        """Select a slot by number, falling back to basic extraction when the choice is unclear"""
+        state['slot_choice'] = None
+        if 1 <= slot_num <= len(available_slots):
+            state['selected_slot'] = available_slots[slot_num - 1]
+        else:
+            self._basic_slot_extraction(state, user_input, available_slots)
+    
+    def _apply_slot_response(self, state: Dict, response: str, available_slots: List):
+        """Select the slot named by the model's numeric answer"""
+        slot_num = int(response)
+        if 1 <= slot_num <= len(available_slots):
+            state['selected_slot'] = available_slots[slot_num - 1]
+    
+    def _confirm_response(self, state: Dict) -> Dict:
+        """Ask the user to confirm the selected slot"""
         selected_slot = state.get('selected_slot')
         if selected_slot:
-            start_time = selected_slot['start'].strftime("%A, %B %d at %I:%M %p")
+            start_time = selected_slot.start.strftime("%A, %B %d at %I:%M %p")
             response = f"Excellent! I've got you down for {start_time}. Should I go ahead and book this for you?"
         else:
             response = "I'm not sure which time you prefer. Could you tell me the number or say something like 'the 2 PM slot'?"
         
-        if 'messages' not in state:
-            state['messages'] = []
-        state['messages'].append(AIMessage(content=response))
+        self._add_reply(state, response)
         return state
     
     def _basic_slot_extraction(self, state: Dict, user_input: str, available_slots: List):
@@ -334,43 +722,60 @@ Which slot number (1-{len(available_slots)}) did they select? Respond with just
         
         # Time-based selection
         for slot in available_slots:
-            slot_time = slot['start'].strftime("%I:%M %p").lower()
+            slot_time = slot.start.strftime("%I:%M %p").lower()
             if slot_time in user_lower or slot_time.replace(':00', '') in user_lower:
                 state['selected_slot'] = slot
                 break
     
     def _extract_slot_number(self, text: str) -> Optional[int]:
         """Extract slot number from user input"""
-        numbers = re.findall(r'\d+', text)
-        return int(numbers[0]) if numbers else None
+        return extract_entities(text).slot_number
     
     def _book_appointment(self, state: Dict) -> Dict:
         """Premium booking experience with follow-up"""
+        booking = self._booking_request(state)
+        success = self.calendar_service.book_appointment(*booking) if booking else False
+        return self._booking_response(state, success)
+    
+    async def _abook_appointment(self, state: Dict) -> Dict:
+        """Async variant of _book_appointment"""
+        booking = self._booking_request(state)
+        success = await self.calendar_service.abook_appointment(*booking) if booking else False
+        return self._booking_response(state, success)
+    
+    def _booking_request(self, state: Dict) -> Optional[tuple]:
+        """Arguments for CalendarService.book_appointment, or None without a selected slot"""
+        selected_slot = state.get('selected_slot')
+        if not selected_slot:
+            return None
+        meeting_type = state.get('meeting_type', 'meeting')
+        duration = state.get('duration', 60)
+        user_name = state.get('user_name', '')
+        return (
+            selected_slot.start,
+            selected_slot.end,
+            f"{meeting_type.title()} - {user_name}" if user_name else f"Scheduled {meeting_type.title()}",
+            f"{duration}-minute {meeting_type} booked via AI assistant"
+        )
+    
+    def _booking_response(self, state: Dict, success: bool) -> Dict:
+        """Confirmation (or failure) message for a booking attempt"""
         selected_slot = state.get('selected_slot')
         if selected_slot:
             meeting_type = state.get('meeting_type', 'meeting')
             duration = state.get('duration', 60)
             user_name = state.get('user_name', '')
-            
-            success = self.calendar_service.book_appointment(
-                selected_slot['start'],
-                selected_slot['end'],
-                f"{meeting_type.title()} - {user_name}" if user_name else f"Scheduled {meeting_type.title()}",
-                f"{duration}-minute {meeting_type} booked via AI assistant"
-            )
+            name_part = f"{user_name}, " if user_name else ""
             
             if success:
-                start_time = selected_slot['start'].strftime("%A, %B %d at %I:%M %p")
-                day_name = selected_slot['start'].strftime("%A")
-                time_only = selected_slot['start'].strftime("%I:%M %p")
-                
-                # Personalized confirmation with helpful details
-                name_part = f"{user_name}, " if user_name else ""
+                start_time = selected_slot.start.strftime("%A, %B %d at %I:%M %p")
+                day_name = selected_slot.start.strftime("%A")
+                time_only = selected_slot.start.strftime("%I:%M %p")
                 
                 # Calculate time until meeting
                 import datetime
                 now = datetime.datetime.now()
-                time_diff = selected_slot['start'] - now
+                time_diff = selected_slot.start - now
                 
                 if time_diff.days == 0:
                     time_context = "today"
@@ -390,13 +795,13 @@ Which slot number (1-{len(available_slots)}) did they select? Respond with just
                 
                 # Add smart features
                 meeting_id = SmartFeatures.generate_meeting_id()
-                time_msg = SmartFeatures.get_time_zone_friendly_message(selected_slot['start'])
+                time_msg = SmartFeatures.get_time_zone_friendly_message(selected_slot.start)
                 prep_tip = SmartFeatures.suggest_meeting_prep(meeting_type, duration)
                 
                 response += f"\n\n{time_msg}\n{prep_tip}\n\n🆔 Meeting ID: {meeting_id}"
                 
                 if time_diff.days > 0:
-                    weather = SmartFeatures.get_weather_context(selected_slot['start'])
+                    weather = SmartFeatures.get_weather_context(selected_slot.start)
                     response += f"\n🌤️ {weather}"
                 
                 # Add helpful follow-up
@@ -413,7 +818,7 @@ Which slot number (1-{len(available_slots)}) did they select? Respond with just
                 self.user_preferences[user_name or 'user'] = {
                     'preferred_duration': duration,
                     'preferred_meeting_type': meeting_type,
-                    'last_booking': selected_slot['start'].isoformat()
+                    'last_booking': selected_slot.start.isoformat()
                 }
                 
             else:
@@ -421,23 +826,84 @@ Which slot number (1-{len(available_slots)}) did they select? Respond with just
         else:
             response = "Hmm, I don't have a time slot selected. Let's start fresh - when would you like to meet?"
         
-        if 'messages' not in state:
-            state['messages'] = []
-        state['messages'].append(AIMessage(content=response))
+        self._add_reply(state, response)
         return state
     
     def process_message(self, message: str, state: Dict) -> tuple:
         """Process user message and return response"""
-        if 'messages' not in state:
-            state['messages'] = []
-        
-        state['messages'].append(HumanMessage(content=message))
+        self._add_message(state, HumanMessage(content=message))
         
         # Run the graph
         result = self.graph.invoke(state)
         
-        # Get the last AI message
-        ai_messages = [msg for msg in result['messages'] if isinstance(msg, AIMessage)]
-        response = ai_messages[-1].content if ai_messages else "I'm here to help you book an appointment. What would you like to schedule?"
+        return self._latest_reply(result), result
+    
+    async def aprocess_message(self, message: str, state: Dict) -> tuple:
+        """Async variant of process_message, running the graph with ainvoke"""
+        self._add_message(state, HumanMessage(content=message))
+        
+        result = await self.graph.ainvoke(state)
+        
+        return self._latest_reply(result), result
+    
+    async def aprocess_batch(self, items: List[Tuple[str, Dict]]) -> List:
+        """Process (message, state) pairs for distinct sessions concurrently.
+        
+        Intent prompts for the whole batch go out through one abatch call per
+        model, and turns asking for the same calendar window share one lookup.
+        Returns a (response, state) tuple or the raised exception per item.
+        """
+        for message, state in items:
+            self._add_message(state, HumanMessage(content=message))
         
-        return response, result
\ No newline at end of file
+        scope = {'now': datetime.now(), 'answers': {}, 'lookups': {}}
+        token = BATCH_SCOPE.set(scope)
+        try:
+            scope['answers'] = await self._aprefetch_answers([state for _, state in items])
+            results = await asyncio.gather(*(self.graph.ainvoke(state) for _, state in items), return_exceptions=True)
+        finally:
+            BATCH_SCOPE.reset(token)
+        
+        return [result if isinstance(result, Exception) else (self._latest_reply(result), result) for result in results]
+    
+    async def astream_message(self, message: str, state: Dict) -> AsyncIterator[Dict]:
+        """Process a message, yielding a progress event as each graph node starts and the reply at the end"""
+        self._add_message(state, HumanMessage(content=message))
+        
+        result = state
+        async for mode, chunk in self.graph.astream(state, stream_mode=["tasks", "values"]):
+            if mode == "values":
+                result = chunk
+            elif 'input' in chunk and chunk['name'] in NODE_PROGRESS:
+                yield {'event': 'progress', 'node': chunk['name'], 'label': NODE_PROGRESS[chunk['name']]}
+        
+        yield {'event': 'reply', 'response': self._latest_reply(result), 'state': result}
+    
+    def _add_message(self, state: Dict, message) -> None:
+        """Append to the bounded history, folding whatever falls out of the window into the summary"""
+        messages = state.get('messages')
+        if not isinstance(messages, MessageWindow):
+            # New sessions and ones restored from storage arrive as plain lists
+            messages = state['messages'] = self._to_window(state, messages or [])
+        evicted = messages.append(message)
+        if evicted is not None:
+            state['history_summary'] = roll_summary(state.get('history_summary') or '', evicted, config.HISTORY_SUMMARY_CHARS)
+        if isinstance(message, HumanMessage):
+            # A turn that ends without replying must not repeat the previous answer
+            state['last_reply'] = None
+    
+    def _to_window(self, state: Dict, messages: List) -> MessageWindow:
+        window = MessageWindow(config.HISTORY_WINDOW)
+        for message in messages:
+            evicted = window.append(message)
+            if evicted is not None:
+                state['history_summary'] = roll_summary(state.get('history_summary') or '', evicted, config.HISTORY_SUMMARY_CHARS)
+        return window
+    
+    def _add_reply(self, state: Dict, response: str) -> None:
+        self._add_message(state, AIMessage(content=response))
+        state['last_reply'] = response
+    
+    def _latest_reply(self, result: Dict) -> str:
+        """Get the last AI message"""
+        return result.get('last_reply') or "I'm here to help you book an appointment. What would you like to schedule?"
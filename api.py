@@ -1,15 +1,90 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hmac
+import json
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
-from agent import BookingAgent
+from datetime import datetime
+from typing import Dict, Any, List, Optional
 import uvicorn
 from config import config
+from worker_pool import BoundedWorkerPool, PoolSaturated, DeadlineExceeded
+from session_store import copy_session_state, create_session_store
+from metrics import REQUEST_LATENCY, render_metrics
+from diagnostics import format_collapsed, memory_snapshot, sample_stacks, stop_memory_tracing
 
-app = FastAPI(title="Calendar Booking Agent API")
+# Global agent instance, built in the background at startup (see /ready)
+booking_agent = None
+_agent_lock = threading.Lock()
+_startup = {'started': time.monotonic(), 'ready_seconds': None, 'error': None}
+user_sessions = create_session_store(
+    config.SESSION_BACKEND,
+    config.SESSION_DB_PATH,
+    ttl_seconds=config.SESSION_TTL_SECONDS,
+    max_sessions=config.SESSION_MAX_COUNT,
+    max_session_bytes=config.SESSION_MAX_BYTES,
+    sweep_interval=config.SESSION_SWEEP_INTERVAL_SECONDS
+)
 
-# Global agent instance
-booking_agent = BookingAgent()
-user_sessions: Dict[str, Dict] = {}
+# Optional thread pool for the synchronous agent path
+chat_pool = BoundedWorkerPool(
+    config.CHAT_WORKER_THREADS,
+    config.CHAT_QUEUE_SIZE,
+    config.CHAT_DEADLINE_SECONDS
+) if config.CHAT_WORKER_THREADS > 0 else None
+
+def get_booking_agent():
+    """Return the shared agent, building it on first use"""
+    global booking_agent
+    with _agent_lock:
+        if booking_agent is None:
+            # agent pulls in langgraph and LangChain, so it is imported here rather than at startup
+            from agent import BookingAgent
+            booking_agent = BookingAgent()
+            _startup['ready_seconds'] = round(time.monotonic() - _startup['started'], 3)
+    return booking_agent
+
+async def ready_agent():
+    """The shared agent, waiting off the event loop if warmup hasn't finished"""
+    if booking_agent is not None:
+        return booking_agent
+    return await asyncio.to_thread(get_booking_agent)
+
+def _warm_up():
+    """Build the agent and prime the calendar cache before the first request needs them"""
+    try:
+        agent = get_booking_agent()
+        if agent.calendar_service.event_store is not None:
+            agent.calendar_service.event_store.sync()
+    except Exception as e:
+        _startup['error'] = str(e)
+        print(f"Warmup failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    user_sessions.start_sweeper()
+    warmup = asyncio.create_task(asyncio.to_thread(_warm_up))
+    yield
+    await warmup
+    user_sessions.stop_sweeper()
+    if chat_pool is not None:
+        chat_pool.shutdown()
+
+app = FastAPI(title="Calendar Booking Agent API", lifespan=lifespan)
+
+TIMED_ENDPOINTS = {"/chat", "/chat/batch", "/chat/stream", "/book/bulk"}
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """Record request latency for the chat and booking endpoints"""
+    if request.url.path not in TIMED_ENDPOINTS:
+        return await call_next(request)
+    with REQUEST_LATENCY.time(endpoint=request.url.path):
+        return await call_next(request)
 
 class ChatMessage(BaseModel):
     message: str
@@ -19,49 +94,211 @@ class ChatResponse(BaseModel):
     response: str
     session_id: str
 
+class BatchChatRequest(BaseModel):
+    items: List[ChatMessage]
+
+class BatchChatResult(BaseModel):
+    session_id: str
+    response: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult]
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(chat_message: ChatMessage):
-    """Process chat message and return AI response"""
+    """Process chat message and return AI response.
+    
+    The turn runs on a copy of the session, stored only once it completes.
+    A 504 leaves the session as it was, but a worker past its deadline is
+    not interrupted: a booking it already started can still be created.
+    """
     try:
-        # Get or create session state
-        if chat_message.session_id not in user_sessions:
-            user_sessions[chat_message.session_id] = {
-                'messages': [],
-                'intent': None,
-                'date_preference': None,
-                'time_preference': None,
-                'duration': 60,
-                'available_slots': [],
-                'selected_slot': None,
-                'booking_confirmed': False,
-                'user_name': None
-            }
-        
-        state = user_sessions[chat_message.session_id]
+        # Get or create session state; the stored copy changes only on success
+        state = copy_session_state(user_sessions.get_or_create(chat_message.session_id))
         
-        # Process message
-        response, updated_state = booking_agent.process_message(chat_message.message, state)
+        # Process message without blocking the event loop
+        booking_agent = await ready_agent()
+        if chat_pool is not None:
+            response, updated_state = await chat_pool.run(booking_agent.process_message, chat_message.message, state)
+        else:
+            response, updated_state = await booking_agent.aprocess_message(chat_message.message, state)
         
         # Update session state
-        user_sessions[chat_message.session_id] = updated_state
+        user_sessions.put(chat_message.session_id, updated_state)
         
         return ChatResponse(response=response, session_id=chat_message.session_id)
     
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(batch: BatchChatRequest):
+    """Process many sessions' messages concurrently, returning a response or error per item"""
+    if len(batch.items) > config.CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {config.CHAT_BATCH_MAX_ITEMS} items")
+    
+    # A session's messages must run in order, so each round takes at most one per session
+    rounds: List[List[int]] = []
+    seen: Dict[str, int] = {}
+    for index, item in enumerate(batch.items):
+        position = seen.get(item.session_id, 0)
+        seen[item.session_id] = position + 1
+        if position == len(rounds):
+            rounds.append([])
+        rounds[position].append(index)
+    
+    booking_agent = await ready_agent()
+    results: List[Optional[BatchChatResult]] = [None] * len(batch.items)
+    for indexes in rounds:
+        items = [batch.items[index] for index in indexes]
+        # Each item runs on a copy, so a failed item leaves its stored session untouched
+        states = [copy_session_state(user_sessions.get_or_create(item.session_id)) for item in items]
+        outcomes = await booking_agent.aprocess_batch([(item.message, state) for item, state in zip(items, states)])
+        for index, item, outcome in zip(indexes, items, outcomes):
+            if isinstance(outcome, Exception):
+                results[index] = BatchChatResult(session_id=item.session_id, error=f"Error processing message: {str(outcome)}")
+            else:
+                response, updated_state = outcome
+                user_sessions.put(item.session_id, updated_state)
+                results[index] = BatchChatResult(session_id=item.session_id, response=response)
+    
+    return BatchChatResponse(results=results)
+
+class BookingItem(BaseModel):
+    start: datetime
+    end: datetime
+    title: str
+    description: str = ""
+
+class BulkBookingRequest(BaseModel):
+    bookings: List[BookingItem]
+
+class BookingResult(BaseModel):
+    success: bool
+    event_id: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkBookingResponse(BaseModel):
+    results: List[BookingResult]
+
+@app.post("/book/bulk", response_model=BulkBookingResponse)
+async def book_bulk(request: BulkBookingRequest):
+    """Book many appointments with batched Calendar API requests, reporting each outcome"""
+    if len(request.bookings) > config.BOOK_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Request exceeds {config.BOOK_BULK_MAX_ITEMS} bookings")
+    
+    booking_agent = await ready_agent()
+    results = await booking_agent.calendar_service.abook_appointments_bulk(
+        [(item.start, item.end, item.title, item.description) for item in request.bookings]
+    )
+    return BulkBookingResponse(results=[BookingResult(**result) for result in results])
+
+def _sse(event: str, data: Dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(chat_message: ChatMessage):
+    """Process chat message, streaming node progress and then the reply as Server-Sent Events.
+    
+    Like /chat, the turn runs on a copy of the session that is stored only
+    when the reply is ready, so an error or a client disconnect mid-turn
+    leaves the session as it was.
+    """
+    session_id = chat_message.session_id
+    state = copy_session_state(user_sessions.get_or_create(session_id))
+    
+    async def events():
+        try:
+            booking_agent = await ready_agent()
+            async for update in booking_agent.astream_message(chat_message.message, state):
+                if update['event'] == 'progress':
+                    yield _sse('progress', {'node': update['node'], 'label': update['label']})
+                else:
+                    user_sessions.put(session_id, update['state'])
+                    # Reply text is templated, so stream it word by word
+                    for token in re.findall(r'\s*\S+', update['response']):
+                        yield _sse('token', {'text': token})
+                    yield _sse('done', {'session_id': session_id})
+        except Exception as e:
+            yield _sse('error', {'detail': f"Error processing message: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 503 until the agent has finished warming up"""
+    if booking_agent is None:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "error": _startup['error']})
+    return {"status": "ready", "startup_seconds": _startup['ready_seconds']}
+
+@app.get("/stats")
+async def stats():
+    """Runtime statistics for the chat worker pool, session store and intent resolution"""
+    return {
+        "chat_pool": chat_pool.stats() if chat_pool is not None else None,
+        "sessions": user_sessions.stats(),
+        "intent_cache": booking_agent.intent_cache.stats() if booking_agent is not None else None,
+        "intent_paths": booking_agent.intent_path_stats() if booking_agent is not None else None
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Node, LLM, calendar and request latency histograms plus fallback counters, in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow /debug endpoints only with the configured admin token; hide them when none is set"""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+_profile_lock = asyncio.Lock()
+
+@app.get("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def debug_profile(seconds: float = Query(5.0, gt=0), interval_ms: float = Query(5.0, ge=1)):
+    """Sample all threads' stacks for a while and return them in collapsed (flamegraph) format"""
+    if seconds > config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {config.PROFILE_MAX_SECONDS}")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profile_lock:
+        # Sample from a worker thread so the event loop keeps serving (and shows up in the profile)
+        stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000)
+    return PlainTextResponse(format_collapsed(stacks))
+
+@app.get("/debug/memory", dependencies=[Depends(require_admin)])
+async def debug_memory(top: int = Query(20, ge=1, le=200), stop: bool = False):
+    """tracemalloc's top allocation sites plus per-session size estimates"""
+    if stop:
+        stop_memory_tracing()
+        return {"tracing": False}
+    return {
+        "allocations": memory_snapshot(top),
+        "sessions": user_sessions.size_report(top)
+    }
+
 @app.delete("/session/{session_id}")
 async def clear_session(session_id: str):
     """Clear a specific session"""
-    if session_id in user_sessions:
-        del user_sessions[session_id]
+    if user_sessions.delete(session_id):
         return {"message": f"Session {session_id} cleared"}
     return {"message": "Session not found"}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host=config.API_HOST, port=config.API_PORT)
\ No newline at end of file
+    if config.API_WORKERS > 1:
+        # Multiple workers need an import string and a shared session backend
+        uvicorn.run("api:app", host=config.API_HOST, port=config.API_PORT, workers=config.API_WORKERS)
+    else:
+        uvicorn.run(app, host=config.API_HOST, port=config.API_PORT)
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Bitmap availability index for calendar windows
+"""
+from datetime import datetime
+from math import ceil, gcd
+from typing import List, Optional
+
+import numpy as np
+
+from slots import Slot, to_epoch_minute
+
+
+class AvailabilityIndex:
+    """Busy bitmap for one window origin, answering free-slot queries for any duration.
+
+    Busy intervals are rasterized once into fixed-size cells starting at
+    ``origin`` (9:00 on the first day of the window). A prefix sum over the
+    bitmap turns "is every cell of this slot free?" into one subtraction, so
+    each query is a handful of vectorized operations over the candidate grid.
+    """
+
+    DEFAULT_RESOLUTION_MINUTES = 5
+    SLOT_STEP_MINUTES = 30
+
+    def __init__(self, origin: datetime, busy_starts: List[datetime], busy_ends: List[datetime],
+                 resolution_minutes: int = DEFAULT_RESOLUTION_MINUTES):
+        self.origin = origin
+        self.exact = True
+
+        offsets = []
+        for start, end in zip(busy_starts, busy_ends):
+            start_offset = (start - origin).total_seconds() / 60
+            end_offset = (end - origin).total_seconds() / 60
+            if end_offset <= 0:
+                continue
+            if start_offset >= end_offset or not start_offset.is_integer() or not end_offset.is_integer():
+                # Zero-length or sub-minute intervals cannot be represented exactly
+                self.exact = False
+            offsets.append((max(int(start_offset), 0), int(end_offset)))
+
+        # Drop to one-minute cells if any boundary falls off the coarse grid
+        for start_offset, end_offset in offsets:
+            resolution_minutes = gcd(resolution_minutes, gcd(start_offset, end_offset))
+        self.resolution = max(resolution_minutes, 1)
+
+        cells = max((end for _, end in offsets), default=0) // self.resolution
+        edges = np.zeros(cells + 1, dtype=np.int32)
+        if offsets:
+            bounds = np.array(offsets, dtype=np.int64) // self.resolution
+            np.add.at(edges, bounds[:, 0], 1)
+            np.add.at(edges, bounds[:, 1], -1)
+        busy = np.cumsum(edges[:-1]) > 0
+        self._busy_prefix = np.concatenate(([0], np.cumsum(busy, dtype=np.int64)))
+
+    def free_slots(self, end_date: datetime, duration_minutes: int) -> Optional[List[Slot]]:
+        """Free weekday 9-17 slots starting before end_date, or None if the index can't answer exactly"""
+        if not self.exact or duration_minutes <= 0:
+            return None
+        if end_date <= self.origin:
+            return []
+
+        step = self.SLOT_STEP_MINUTES
+        count = ceil((end_date - self.origin).total_seconds() / 60 / step)
+        offsets = np.arange(count, dtype=np.int64) * step
+
+        # Working-hours rule on the candidate start times (naive wall clock)
+        candidates = np.datetime64(self.origin, 'm') + offsets.astype('timedelta64[m]')
+        days = candidates.astype('datetime64[D]')
+        weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        hour = (candidates - days).astype(np.int64) // 60
+        mask = (weekday < 5) & (hour >= 9) & (hour < 17)
+
+        # Every cell touched by [start, start + duration) must be free
+        last_cell = len(self._busy_prefix) - 1
+        first = np.minimum(offsets // self.resolution, last_cell)
+        last = np.minimum((offsets + duration_minutes + self.resolution - 1) // self.resolution, last_cell)
+        mask &= self._busy_prefix[last] == self._busy_prefix[first]
+
+        starts = (offsets[mask] + to_epoch_minute(self.origin)).tolist()
+        return [Slot(start, start + duration_minutes) for start in starts]
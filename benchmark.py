@@ -0,0 +1,509 @@
+"""
+Microbenchmarks for the agent's hot paths
+
+Runs offline against fakes.FakeCalendarService and fakes.FakeChatModel,
+writes results as JSON and compares them with the previous run. Every run
+first checks the free-slot paths against the original nested loop on
+randomized calendars and stops if they disagree.
+
+Usage: python benchmark.py [--output benchmark_results.json] [--skip-startup] [--check-only]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from extractors import extract_entities
+
+# Changes beyond this fraction are flagged when comparing with the previous run
+REGRESSION_THRESHOLD = 0.10
+
+SAMPLE_MESSAGES = [
+    "I want to schedule a call for tomorrow afternoon",
+    "Do you have any free time this Friday?",
+    "Book a meeting between 3-5 PM next week",
+    "What slots are available tomorrow morning?",
+    "Schedule a 30-minute call for next Monday",
+    "hi, my name is sam. can you book a 45 minute call on 10/24 around 3pm?",
+    "the second one please",
+    "2",
+    "yes, book it",
+    "I'm Priya, anything free today at 4:30 pm?",
+]
+
+
+# Helpers as they were before extractors.py, kept as the comparison baseline
+def _legacy_extract_date_info(text: str) -> Optional[str]:
+    date_patterns = [
+        r'tomorrow',
+        r'today',
+        r'next week',
+        r'this week',
+        r'monday|tuesday|wednesday|thursday|friday|saturday|sunday',
+        r'\d{1,2}[/-]\d{1,2}',
+        r'next \w+day'
+    ]
+    for pattern in date_patterns:
+        if re.search(pattern, text, re.IGNORECASE):
+            return re.search(pattern, text, re.IGNORECASE).group()
+    return None
+
+
+def _legacy_extract_time_info(text: str) -> Optional[str]:
+    time_patterns = [
+        r'\d{1,2}:\d{2}\s*(am|pm)?',
+        r'\d{1,2}\s*(am|pm)',
+        r'morning|afternoon|evening',
+        r'between\s+\d+.*\d+',
+        r'\d+-\d+\s*pm'
+    ]
+    for pattern in time_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group()
+    return None
+
+
+def _legacy_extract_slot_number(text: str) -> Optional[int]:
+    numbers = re.findall(r'\d+', text)
+    return int(numbers[0]) if numbers else None
+
+
+def _legacy_extract_name(user_input: str) -> Optional[str]:
+    if 'my name is' in user_input.lower() or 'i\'m ' in user_input.lower():
+        import re
+        name_match = re.search(r'(?:my name is|i\'m|call me)\s+([a-zA-Z]+)', user_input.lower())
+        if name_match:
+            return name_match.group(1).title()
+    return None
+
+
+def _legacy_parse_duration(duration_str: str) -> int:
+    import re
+    if 'hour' in duration_str:
+        hours = re.findall(r'(\d+)', duration_str)
+        return int(hours[0]) * 60 if hours else 60
+    elif 'min' in duration_str:
+        mins = re.findall(r'(\d+)', duration_str)
+        return int(mins[0]) if mins else 60
+    return 60
+
+
+def _legacy_free_slots(busy_times: List, start_date: datetime, end_date: datetime, duration_minutes: int) -> List:
+    """The original nested-loop _calculate_free_slots, as (start, end) pairs"""
+    free_slots = []
+    current = start_date.replace(hour=9, minute=0, second=0, microsecond=0)
+    while current < end_date:
+        if current.weekday() < 5 and 9 <= current.hour < 17:
+            slot_end = current + timedelta(minutes=duration_minutes)
+            if not any(current < busy_end and slot_end > busy_start for busy_start, busy_end in busy_times):
+                free_slots.append((current, slot_end))
+        current += timedelta(minutes=30)
+    return free_slots
+
+
+def _random_busy_times(rng: random.Random, start: datetime, days: int) -> List:
+    """Busy intervals that stress the merge and index paths: overlaps, zero-length and sub-minute edges"""
+    busy_times = []
+    for _ in range(rng.randint(0, days * 8)):
+        begin = start + timedelta(minutes=rng.randrange(0, days * 24 * 60, rng.choice((1, 5, 15, 30))))
+        kind = rng.random()
+        if kind < 0.1:
+            end = begin  # zero-length
+        elif kind < 0.25:
+            begin += timedelta(seconds=rng.randint(1, 59))  # sub-minute start
+            end = begin + timedelta(minutes=rng.randint(0, 90), seconds=rng.randint(0, 59))
+        else:
+            end = begin + timedelta(minutes=rng.choice((5, 15, 30, 45, 60, 90, 120, 240)))
+        busy_times.append((begin, end))
+        if rng.random() < 0.3:
+            # An overlapping or contained neighbour
+            busy_times.append((begin + (end - begin) / 2, end + timedelta(minutes=rng.randint(-30, 60))))
+    return busy_times
+
+
+def check_free_slots(calendars: int = 300, seed: int = 0) -> Dict[str, int]:
+    """Compare the index, sweep and paged free-slot paths with the original nested loop on random calendars.
+
+    Raises AssertionError on the first calendar where any path disagrees.
+    """
+    from calendar_service import CalendarService
+    from fakes import FakeCalendarService
+
+    rng = random.Random(seed)
+    compared = 0
+    for n in range(calendars):
+        start = datetime(2030, 1, 7, rng.randint(0, 23), rng.choice((0, 17, 30)))
+        end = start + timedelta(days=rng.randint(1, 10), minutes=rng.randint(0, 90))
+        busy_times = _random_busy_times(rng, start - timedelta(days=1), (end - start).days + 2)
+        calendar = FakeCalendarService(page_size=rng.randint(1, 50))
+        for busy_start, busy_end in busy_times:
+            if busy_end > busy_start:  # the fake, like Google, rejects empty events
+                calendar.add_busy(busy_start, busy_end)
+        service = CalendarService(calendar)
+        service.event_store = None
+        for duration in (15, 30, 45, 60, 90):
+            expected = _legacy_free_slots(busy_times, start, end, duration)
+            busy_starts, busy_ends = service._merge_busy_times(busy_times)
+            paths = {
+                'index': service._free_slots_from_busy(busy_times, start, end, duration),
+                'sweep': service._sweep_free_slots(busy_starts, busy_ends, start, end, duration),
+            }
+            for name, slots in paths.items():
+                got = [(slot.start, slot.end) for slot in slots]
+                assert got == expected, f"{name} path differs from the nested loop (calendar {n}, seed {seed}, {duration} min)"
+                compared += 1
+            if all(busy_end > busy_start for busy_start, busy_end in busy_times):
+                # Like the original events().list call, the paged path only sees events overlapping the window
+                in_window = [(busy_start, busy_end) for busy_start, busy_end in busy_times if busy_end > start and busy_start < end]
+                got = [(slot.start, slot.end) for slot in service.iter_free_slots(start, end, duration)]
+                assert got == _legacy_free_slots(in_window, start, end, duration), \
+                    f"paged path differs from the nested loop (calendar {n}, seed {seed}, {duration} min)"
+                compared += 1
+    return {'calendars': calendars, 'comparisons': compared}
+
+
+def _legacy_turn(message: str):
+    """Extraction work of one turn with the old helpers: intent, routing and slot selection"""
+    lowered = message.lower()
+    _legacy_extract_name(message)
+    _legacy_extract_date_info(lowered)
+    _legacy_extract_time_info(lowered)
+    _legacy_parse_duration(lowered)
+    _legacy_extract_slot_number(lowered)
+
+
+def _engine_turn(message: str):
+    """The same turn with the shared extraction engine (cold cache)"""
+    extract_entities.cache_clear()
+    entities = extract_entities(message)
+    entities.name, entities.date, entities.time, entities.duration, entities.slot_number
+
+
+def _time_per_call(func: Callable, messages: List[str], rounds: int) -> float:
+    """Mean microseconds per call over all messages"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            func(message)
+    return (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+
+def bench_extractors(rounds: int = 2000) -> Dict[str, float]:
+    # Check the engine agrees with the helpers it replaces before timing it
+    for message in SAMPLE_MESSAGES:
+        lowered = message.lower()
+        entities = extract_entities(message)
+        assert entities.date == _legacy_extract_date_info(lowered), message
+        assert entities.time == _legacy_extract_time_info(lowered), message
+        assert entities.slot_number == _legacy_extract_slot_number(lowered), message
+        assert entities.name == _legacy_extract_name(message), message
+
+    legacy = _time_per_call(_legacy_turn, SAMPLE_MESSAGES, rounds)
+    engine = _time_per_call(_engine_turn, SAMPLE_MESSAGES, rounds)
+    return {
+        'legacy_us_per_turn': round(legacy, 2),
+        'engine_us_per_turn': round(engine, 2),
+        'speedup': round(legacy / engine, 2)
+    }
+
+
+def _time_repeated(func: Callable, rounds: int, repeats: int = 5) -> float:
+    """Microseconds per call of func(): the best over repeats of the mean of rounds calls.
+
+    The minimum is the least noisy estimate on a shared machine, as with timeit.
+    """
+    func()  # warm caches outside the timed loop
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        samples.append((time.perf_counter() - start) / rounds * 1e6)
+    return min(samples)
+
+
+def _calendar_window():
+    """A fixed Monday-start window so calendars and slots are identical on every run"""
+    start = datetime(2030, 1, 7, 8, 0)
+    return start, start + timedelta(days=14)
+
+
+def bench_free_slots(rounds: int = 50) -> Dict[str, float]:
+    from calendar_service import CalendarService
+    from fakes import busy_calendar
+
+    start, end = _calendar_window()
+    results = {}
+    for size, events_per_day in (('small', 3), ('large', 40)):
+        calendar = busy_calendar(start, 14, events_per_day)
+        calendar.page_size = events_per_day * 14
+        service = CalendarService(calendar)
+        events = calendar.events().list(calendarId='primary').execute()['items']
+        results[f'calculate_{size}_us'] = round(_time_repeated(
+            lambda: service._calculate_free_slots(events, start, end, 60), rounds), 2)
+        # Without the index cache, every call parses, merges and rebuilds
+        results[f'calculate_{size}_uncached_us'] = round(_time_repeated(
+            lambda: (service._availability_indexes.clear(), service._calculate_free_slots(events, start, end, 60)), rounds), 2)
+        results[f'events_{size}'] = len(events)
+
+    # Straight from the API (no event cache): paging stops once enough slots are found
+    calendar = busy_calendar(start, 14, 6)
+    calendar.page_size = 25
+    direct = CalendarService(calendar)
+    direct.event_store = None
+    for name, limit in (('first5', 5), ('all', None)):
+        calendar.calls['list'] = 0
+        direct.get_free_slots(start, end, 30, limit=limit)
+        results[f'paged_{name}_list_calls'] = calendar.calls['list']
+        results[f'paged_{name}_us'] = round(_time_repeated(lambda: direct.get_free_slots(start, end, 30, limit=limit), rounds), 2)
+
+    # Top-5 ranking over the whole window (heap) vs the first five unranked slots
+    cached = CalendarService(busy_calendar(start, 14, 3))
+    results['first5_unranked_us'] = round(_time_repeated(lambda: cached.get_free_slots(start, end, 30, limit=5), rounds), 2)
+    results['top5_ranked_us'] = round(_time_repeated(
+        lambda: cached.get_ranked_free_slots(start, end, 30, 5, 'afternoon'), rounds), 2)
+    results['top5_ranked_paged_us'] = round(_time_repeated(
+        lambda: direct.get_ranked_free_slots(start, end, 30, 5, 'afternoon'), rounds), 2)
+
+    mock = CalendarService(busy_calendar(start, 1, 0))
+    results['mock_us'] = round(_time_repeated(lambda: mock._get_mock_free_slots(start, end, 60), rounds * 10), 2)
+    return results
+
+
+def _traced_bytes(func: Callable) -> Dict[str, int]:
+    """Bytes still held by func()'s result, and the peak allocated while it ran"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {'retained': retained - before, 'peak': peak - before}
+
+
+def bench_slot_memory(count: int = 10000) -> Dict[str, float]:
+    """Resident cost of slot lists, and allocation peak of a free-slot computation"""
+    from calendar_service import CalendarService
+    from fakes import busy_calendar
+    from slots import Slot
+
+    start, end = _calendar_window()
+    slot_list = lambda: [Slot(i * 30, i * 30 + 60) for i in range(count)]
+    # The dict shape slots had before Slot: two datetimes and a title per slot
+    dict_list = lambda: [{'start': slot.start, 'end': slot.end, 'title': 'Available slot'}
+                         for slot in (Slot(i * 30, i * 30 + 60) for i in range(count))]
+    results = {
+        'slot_bytes': round(_traced_bytes(slot_list)['retained'] / count, 1),
+        'dict_slot_bytes': round(_traced_bytes(dict_list)['retained'] / count, 1)
+    }
+
+    for size, events_per_day in (('small', 3), ('large', 40)):
+        calendar = busy_calendar(start, 14, events_per_day)
+        calendar.page_size = events_per_day * 14
+        service = CalendarService(calendar)
+        events = calendar.events().list(calendarId='primary').execute()['items']
+        service._calculate_free_slots(events, start, end, 30)  # keep the cached index out of the trace
+        usage = _traced_bytes(lambda: service._calculate_free_slots(events, start, end, 30))
+        results[f'calculate_{size}_peak_bytes'] = usage['peak']
+        results[f'calculate_{size}_retained_bytes'] = usage['retained']
+    return results
+
+
+def _bench_agent(model_path: bool):
+    """BookingAgent built on the offline fakes; model_path disables the intent cache.
+
+    The rule fast path is switched off separately, with _without_fast_path,
+    because the agent reads its threshold from config on every turn.
+    """
+    from agent import BookingAgent
+    from calendar_service import CalendarService
+    from fakes import FakeChatModel, busy_calendar
+    from intent_cache import IntentCache
+
+    start, _ = _calendar_window()
+    agent = BookingAgent(calendar_service=CalendarService(busy_calendar(start, 30, 6)), llm=FakeChatModel())
+    if model_path:
+        agent.intent_cache = IntentCache(max_entries=0)
+    return agent
+
+
+@contextmanager
+def _without_fast_path(enabled: bool = True) -> Iterator[None]:
+    """Send every turn to the model by raising the rule-confidence threshold above 1"""
+    from config import config
+
+    threshold = config.INTENT_FAST_PATH_THRESHOLD
+    if enabled:
+        config.INTENT_FAST_PATH_THRESHOLD = 1.1
+    try:
+        yield
+    finally:
+        config.INTENT_FAST_PATH_THRESHOLD = threshold
+
+
+def _history(turns: int) -> List:
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]))
+        messages.append(AIMessage(content="Great! I found these available times for your meeting."))
+    return messages
+
+
+def bench_suggest_slots(rounds: int = 500) -> Dict[str, float]:
+    from session_store import new_session_state
+    from slots import Slot
+
+    agent = _bench_agent(model_path=False)
+    start, _ = _calendar_window()
+    slots = [Slot.from_datetimes(start + timedelta(hours=i), start + timedelta(hours=i, minutes=30)) for i in range(10)]
+
+    def render():
+        state = dict(new_session_state(), available_slots=slots, duration=30, time_preference='afternoon')
+        agent._suggest_slots(state)
+
+    return {'render_us': round(_time_repeated(render, rounds), 2)}
+
+
+def bench_graph_turn(rounds: int = 10) -> Dict[str, float]:
+    """One full graph.invoke per user message, over short and long histories"""
+    from session_store import new_session_state
+
+    results = {}
+    for path, model_path in (('rules', False), ('model', True)):
+        agent = _bench_agent(model_path)
+        for history_name, turns in (('short', 0), ('long', 200)):
+            history = _history(turns)
+
+            def turn():
+                for message in SAMPLE_MESSAGES[:5]:
+                    agent.process_message(message, dict(new_session_state(), messages=list(history)))
+
+            with _without_fast_path(model_path):
+                results[f'{path}_{history_name}_us'] = round(_time_repeated(turn, rounds) / 5, 2)
+    return results
+
+
+def bench_long_conversation(turns: int = 1000, sample: int = 100) -> Dict[str, float]:
+    """One session talking for many turns: per-turn cost early and late, and the session size at the end"""
+    from session_store import estimate_session_bytes, new_session_state
+
+    agent = _bench_agent(model_path=False)
+    state = new_session_state()
+    timings = []
+    for i in range(turns):
+        start = time.perf_counter()
+        _, state = agent.process_message(SAMPLE_MESSAGES[i % 5], state)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return {
+        'first_turns_us': round(statistics.median(timings[:sample]), 2),
+        'last_turns_us': round(statistics.median(timings[-sample:]), 2),
+        'messages_kept': len(state['messages']),
+        'session_bytes': estimate_session_bytes(state)
+    }
+
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+api.get_booking_agent()
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def bench_startup(runs: int = 5) -> Dict[str, float]:
+    """Cold start in fresh interpreters: time until the app can serve /health, and until /ready"""
+    imported, ready = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        imported.append(float(output[-2]))
+        ready.append(float(output[-1]))
+    return {
+        'import_app_ms': round(statistics.median(imported) * 1000, 1),
+        'agent_ready_ms': round(statistics.median(ready) * 1000, 1)
+    }
+
+
+def run_suite(skip_startup: bool = False) -> Dict[str, Dict[str, float]]:
+    results = {
+        'extractors': bench_extractors(),
+        'free_slots': bench_free_slots(),
+        'suggest_slots': bench_suggest_slots(),
+        'slot_memory': bench_slot_memory(),
+        'graph_turn': bench_graph_turn(),
+        'long_conversation': bench_long_conversation()
+    }
+    if not skip_startup:
+        results['startup'] = bench_startup()
+    return results
+
+
+def compare(previous: Dict[str, Dict[str, float]], current: Dict[str, Dict[str, float]]) -> List[str]:
+    """Timing and memory changes between two runs, flagging those past REGRESSION_THRESHOLD"""
+    lines = []
+    for group, metrics in current.items():
+        for name, value in metrics.items():
+            before = previous.get(group, {}).get(name)
+            if not before or not name.endswith(('_us', '_ms', '_bytes')):
+                continue
+            change = (value - before) / before
+            flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else "  improved" if change < -REGRESSION_THRESHOLD else ""
+            lines.append(f"{group}.{name}: {before} -> {value} ({change:+.1%}){flag}")
+    return lines
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--output', default='benchmark_results.json', help="JSON file for results; the previous contents are the baseline")
+    arg_parser.add_argument('--skip-startup', action='store_true', help="Skip the cold-start benchmark")
+    arg_parser.add_argument('--check-only', action='store_true', help="Only run the randomized free-slot correctness check")
+    args = arg_parser.parse_args()
+
+    previous: Optional[Dict[str, Any]] = None
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            previous = json.load(f)
+
+    print("free_slots correctness:", check_free_slots())
+    if args.check_only:
+        return
+
+    results = run_suite(skip_startup=args.skip_startup)
+    for group, metrics in results.items():
+        print(f"{group}:", metrics)
+
+    if previous:
+        print(f"\nCompared with {previous['timestamp']}:")
+        for line in compare(previous['results'], results):
+            print(line)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'results': results
+        }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
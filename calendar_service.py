@@ -1,20 +1,48 @@
+import asyncio
 import os
 import pickle
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from itertools import islice
+from typing import Iterator, List, Dict, Optional, Sequence, Tuple
 from config import config
+from event_store import EVENT_FIELDS, EVENTS_PAGE_SIZE, EventStore
+from metrics import CALENDAR_LATENCY, FALLBACKS
+from slot_ranking import rank_slots
+from slots import Slot, to_epoch_minute
+
+try:
+    from availability_index import AvailabilityIndex
+except ImportError:  # numpy not installed - fall back to the interval sweep
+    AvailabilityIndex = None
 
 class CalendarService:
-    def __init__(self):
+    MAX_CACHED_INDEXES = 32
+    FREEBUSY_MAX_CALENDARS = 50  # Google's per-query calendar limit
+    BATCH_MAX_REQUESTS = 50  # Google's recommended batch size
+    
+    def __init__(self, service=None):
         self.service = None
-        self.authenticate()
+        self.event_store = None
+        self._credentials = None
+        self._local = threading.local()
+        self._availability_indexes = OrderedDict()
+        self._index_lock = threading.Lock()
+        if service is not None:
+            self.service = service
+            self._setup_event_store()
+        else:
+            self.authenticate()
     
     def authenticate(self):
         """Authenticate with Google Calendar API"""
+        if config.GOOGLE_API_ENDPOINT:
+            return self._setup_stub_service()
+        
+        # Google client libraries are imported only on the paths that use them,
+        # so the mock service starts without loading them at all
         creds = None
         if os.path.exists(config.GOOGLE_CALENDAR_TOKEN_FILE):
             with open(config.GOOGLE_CALENDAR_TOKEN_FILE, 'rb') as token:
@@ -22,9 +50,11 @@ class CalendarService:
         
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
+                from google.auth.transport.requests import Request
                 creds.refresh(Request())
             else:
                 if os.path.exists(config.GOOGLE_CALENDAR_CREDENTIALS_FILE):
+                    from google_auth_oauthlib.flow import InstalledAppFlow
                     flow = InstalledAppFlow.from_client_secrets_file(
                         config.GOOGLE_CALENDAR_CREDENTIALS_FILE, config.SCOPES)
                     creds = flow.run_local_server(port=0)
@@ -35,81 +65,305 @@ class CalendarService:
             with open(config.GOOGLE_CALENDAR_TOKEN_FILE, 'wb') as token:
                 pickle.dump(creds, token)
         
-        self.service = build('calendar', 'v3', credentials=creds)
+        from googleapiclient.discovery import build
+        self._credentials = creds
+        # The discovery document bundled with the client library avoids a network fetch
+        self.service = build('calendar', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+        self._setup_event_store()
+    
+    def _setup_stub_service(self):
+        """Talk to a local Calendar API stand-in (calendar_stub_server.py) without OAuth"""
+        from google.auth.credentials import AnonymousCredentials
+        from googleapiclient.discovery import build
+        self._credentials = AnonymousCredentials()
+        self.service = build('calendar', 'v3', credentials=self._credentials, static_discovery=True, cache_discovery=False,
+                             client_options={'api_endpoint': config.GOOGLE_API_ENDPOINT.rstrip('/') + '/calendar/v3/'})
+        self._setup_event_store()
+    
+    def _setup_event_store(self):
+        """Attach the local event cache if enabled"""
+        if config.EVENT_CACHE_ENABLED:
+            self.event_store = EventStore(
+                self.service,
+                config.CALENDAR_ID,
+                db_path=config.EVENT_CACHE_DB,
+                min_sync_interval=config.EVENT_SYNC_INTERVAL_SECONDS,
+                execute=self._execute
+            )
+    
+    def _execute(self, request):
+        """Execute an API request on this thread's own HTTP connection (httplib2 is not thread-safe)"""
+        # Single requests carry their method, e.g. 'calendar.events.list'; batches don't
+        with CALENDAR_LATENCY.time(method=getattr(request, 'methodId', None) or 'batch'):
+            if self._credentials is None:
+                return request.execute()
+            http = getattr(self._local, 'http', None)
+            if http is None:
+                from google_auth_httplib2 import AuthorizedHttp
+                import httplib2
+                http = self._local.http = AuthorizedHttp(self._credentials, http=httplib2.Http())
+            return request.execute(http=http)
     
     def _setup_mock_service(self):
         """Setup mock service for demo purposes"""
         self.service = None
         print("Using mock calendar service - Google credentials not found")
     
-    def get_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int = 60) -> List[Dict]:
-        """Get available time slots between start_date and end_date"""
+    def get_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int = 60,
+                       limit: Optional[int] = None) -> List[Slot]:
+        """Get available time slots between start_date and end_date, at most limit of them"""
         if not self.service:
-            return self._get_mock_free_slots(start_date, end_date, duration_minutes)
+            return self._get_mock_free_slots(start_date, end_date, duration_minutes)[:limit]
         
         try:
-            events_result = self.service.events().list(
-                calendarId=config.CALENDAR_ID,
+            if self.event_store is not None:
+                self.event_store.sync()
+                events = self.event_store.events_between(start_date, end_date)
+                return self._calculate_free_slots(events, start_date, end_date, duration_minutes)[:limit]
+            
+            return list(islice(self.iter_free_slots(start_date, end_date, duration_minutes), limit))
+        except Exception as e:
+            print(f"Error fetching calendar events: {e}")
+            FALLBACKS.inc(site='get_free_slots')
+            return self._get_mock_free_slots(start_date, end_date, duration_minutes)[:limit]
+    
+    async def aget_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int = 60,
+                              limit: Optional[int] = None) -> List[Slot]:
+        """Non-blocking get_free_slots: the Google client runs on a worker thread"""
+        return await asyncio.to_thread(self.get_free_slots, start_date, end_date, duration_minutes, limit)
+    
+    def iter_events(self, start_date: datetime, end_date: datetime, calendar_id: Optional[str] = None) -> Iterator[Dict]:
+        """Stream the window's busy events in start order, fetching the next page only when it is reached"""
+        page_token = None
+        while True:
+            params = dict(
+                calendarId=calendar_id or config.CALENDAR_ID,
                 timeMin=start_date.isoformat() + 'Z',
                 timeMax=end_date.isoformat() + 'Z',
                 singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
-            return self._calculate_free_slots(events, start_date, end_date, duration_minutes)
+                orderBy='startTime',
+                fields=EVENT_FIELDS,
+                maxResults=EVENTS_PAGE_SIZE
+            )
+            if page_token:
+                params['pageToken'] = page_token
+            result = self._execute(self.service.events().list(**params))
+            for event in result.get('items', []):
+                if event.get('status') != 'cancelled' and event.get('transparency') != 'transparent':
+                    yield event
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def get_ranked_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int = 60, k: int = 5,
+                              time_preference: Optional[str] = None, urgent: bool = False,
+                              calendar_ids: Optional[Sequence[str]] = None) -> List[Slot]:
+        """The k free slots that best fit the time preference and urgency, in time order.
+        
+        With calendar_ids, a slot must be free on every one of those calendars.
+        Their busy intervals come from a FreeBusy query instead of full event
+        lists; calendars the API can't read are reported and skipped.
+        """
+        origin_minute = to_epoch_minute(start_date)
+        if not self.service:
+            candidates = ((slot, None) for slot in self._get_mock_free_slots(start_date, end_date, duration_minutes))
+            return rank_slots(candidates, k, origin_minute, time_preference, urgent)
+        
+        try:
+            if calendar_ids:
+                busy_times = self._query_busy_times(list(calendar_ids), start_date, end_date)
+            elif self.event_store is not None:
+                self.event_store.sync()
+                events = self.event_store.events_between(start_date, end_date)
+                busy_times = [self._event_bounds(event) for event in events if event.get('transparency') != 'transparent']
+            else:
+                candidates = self._iter_slot_candidates(start_date, end_date, duration_minutes)
+                return rank_slots(candidates, k, origin_minute, time_preference, urgent)
+            busy_starts, busy_ends = self._merge_busy_times(busy_times)
+            slots = self._free_slots_from_merged(busy_starts, busy_ends, start_date, end_date, duration_minutes)
+            return rank_slots(self._with_spacing(slots, busy_starts, busy_ends), k, origin_minute, time_preference, urgent)
         except Exception as e:
             print(f"Error fetching calendar events: {e}")
-            return self._get_mock_free_slots(start_date, end_date, duration_minutes)
+            FALLBACKS.inc(site='get_ranked_free_slots')
+            candidates = ((slot, None) for slot in self._get_mock_free_slots(start_date, end_date, duration_minutes))
+            return rank_slots(candidates, k, origin_minute, time_preference, urgent)
+    
+    async def aget_ranked_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int = 60, k: int = 5,
+                                     time_preference: Optional[str] = None, urgent: bool = False,
+                                     calendar_ids: Optional[Sequence[str]] = None) -> List[Slot]:
+        """Non-blocking get_ranked_free_slots"""
+        return await asyncio.to_thread(self.get_ranked_free_slots, start_date, end_date, duration_minutes, k,
+                                       time_preference, urgent, calendar_ids)
     
-    def _get_mock_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int) -> List[Dict]:
+    def iter_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int = 60) -> Iterator[Slot]:
+        """Lazily yield free slots in time order, reading events only as far as the last slot checked"""
+        return (slot for slot, _ in self._iter_slot_candidates(start_date, end_date, duration_minutes))
+    
+    def _iter_slot_candidates(self, start_date: datetime, end_date: datetime, duration_minutes: int) -> Iterator[Tuple[Slot, Optional[int]]]:
+        """Free slots in time order, each with its spacing in minutes from the nearest busy event.
+        
+        Events arrive sorted by start, so once every event starting before a
+        candidate ends has been read, the candidate is busy exactly when one of
+        them ends after it starts. Stopping early leaves later pages unfetched.
+        """
+        events = self.iter_events(start_date, end_date)
+        pending = None
+        busy_until = None
+        current = start_date.replace(hour=9, minute=0, second=0, microsecond=0)
+        
+        while current < end_date:
+            if current.weekday() < 5 and 9 <= current.hour < 17:
+                slot_end = current + timedelta(minutes=duration_minutes)
+                while True:
+                    if pending is None:
+                        event = next(events, None)
+                        if event is None:
+                            break
+                        pending = self._event_bounds(event)
+                    if pending[0] >= slot_end:
+                        break
+                    busy_until = pending[1] if busy_until is None else max(busy_until, pending[1])
+                    pending = None
+                if busy_until is None or not busy_until > current:
+                    gaps = []
+                    if busy_until is not None:
+                        gaps.append((current - busy_until) // timedelta(minutes=1))
+                    if pending is not None:
+                        gaps.append((pending[0] - slot_end) // timedelta(minutes=1))
+                    yield Slot.from_datetimes(current, slot_end), min(gaps, default=None)
+            
+            current += timedelta(minutes=30)
+    
+    def _query_busy_times(self, calendar_ids: List[str], start_date: datetime, end_date: datetime) -> List[Tuple[datetime, datetime]]:
+        """Busy intervals of every calendar as naive UTC datetimes, one request per 50 calendars"""
+        busy_times = []
+        for i in range(0, len(calendar_ids), self.FREEBUSY_MAX_CALENDARS):
+            result = self._execute(self.service.freebusy().query(body={
+                'timeMin': start_date.isoformat() + 'Z',
+                'timeMax': end_date.isoformat() + 'Z',
+                'items': [{'id': calendar_id} for calendar_id in calendar_ids[i:i + self.FREEBUSY_MAX_CALENDARS]]
+            }))
+            for calendar_id, calendar in result.get('calendars', {}).items():
+                if calendar.get('errors'):
+                    print(f"Skipping calendar {calendar_id} in free/busy query: {calendar['errors']}")
+                    continue
+                for period in calendar.get('busy', []):
+                    busy_times.append((self._to_naive_utc(period['start']), self._to_naive_utc(period['end'])))
+        return busy_times
+    
+    @staticmethod
+    def _to_naive_utc(value: str) -> datetime:
+        """Parse an RFC 3339 timestamp into the naive UTC form used for query windows"""
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+        return parsed
+    
+    def _get_mock_free_slots(self, start_date: datetime, end_date: datetime, duration_minutes: int) -> List[Slot]:
         """Generate mock free slots for demo"""
         slots = []
         current = start_date.replace(hour=9, minute=0, second=0, microsecond=0)
         
         while current < end_date:
             if current.weekday() < 5 and 9 <= current.hour < 17:  # Weekdays 9-5
-                slots.append({
-                    'start': current,
-                    'end': current + timedelta(minutes=duration_minutes),
-                    'title': f'Available slot'
-                })
+                slots.append(Slot.from_datetimes(current, current + timedelta(minutes=duration_minutes)))
             current += timedelta(hours=1)
         
         return slots[:10]  # Return first 10 slots
     
-    def _calculate_free_slots(self, events: List, start_date: datetime, end_date: datetime, duration_minutes: int) -> List[Dict]:
+    def _calculate_free_slots(self, events: List, start_date: datetime, end_date: datetime, duration_minutes: int) -> List[Slot]:
         """Calculate free slots based on existing events"""
-        busy_times = []
-        for event in events:
-            start = datetime.fromisoformat(event['start'].get('dateTime', event['start'].get('date')).replace('Z', '+00:00'))
-            end = datetime.fromisoformat(event['end'].get('dateTime', event['end'].get('date')).replace('Z', '+00:00'))
-            busy_times.append((start, end))
+        busy_times = [self._event_bounds(event) for event in events if event.get('transparency') != 'transparent']
+        return self._free_slots_from_busy(busy_times, start_date, end_date, duration_minutes)
+    
+    @classmethod
+    def _event_bounds(cls, event: Dict) -> Tuple[datetime, datetime]:
+        """An event's start and end as naive UTC, comparable with the naive query window"""
+        start = cls._to_naive_utc(event['start'].get('dateTime', event['start'].get('date')))
+        end = cls._to_naive_utc(event['end'].get('dateTime', event['end'].get('date')))
+        return start, end
+    
+    def _free_slots_from_busy(self, busy_times: List[Tuple[datetime, datetime]], start_date: datetime, end_date: datetime, duration_minutes: int) -> List[Slot]:
+        """Free slots around a set of (possibly overlapping) busy intervals"""
+        busy_starts, busy_ends = self._merge_busy_times(busy_times)
+        return self._free_slots_from_merged(busy_starts, busy_ends, start_date, end_date, duration_minutes)
+    
+    def _free_slots_from_merged(self, busy_starts: List[datetime], busy_ends: List[datetime], start_date: datetime, end_date: datetime, duration_minutes: int) -> List[Slot]:
+        if AvailabilityIndex is not None:
+            origin = start_date.replace(hour=9, minute=0, second=0, microsecond=0)
+            free_slots = self._get_availability_index(origin, busy_starts, busy_ends).free_slots(end_date, duration_minutes)
+            if free_slots is not None:
+                return free_slots
+        
+        return self._sweep_free_slots(busy_starts, busy_ends, start_date, end_date, duration_minutes)
+    
+    def _get_availability_index(self, origin: datetime, busy_starts: List[datetime], busy_ends: List[datetime]):
+        """Return the cached bitmap index for this window origin and busy set, building it if needed"""
+        key = (origin, tuple(busy_starts), tuple(busy_ends))
+        with self._index_lock:
+            index = self._availability_indexes.get(key)
+            if index is not None:
+                self._availability_indexes.move_to_end(key)
+                return index
         
+        # Built outside the lock; concurrent builders of the same key just race to store it
+        index = AvailabilityIndex(origin, busy_starts, busy_ends)
+        with self._index_lock:
+            self._availability_indexes[key] = index
+            self._availability_indexes.move_to_end(key)
+            while len(self._availability_indexes) > self.MAX_CACHED_INDEXES:
+                self._availability_indexes.popitem(last=False)
+        return index
+    
+    def _sweep_free_slots(self, busy_starts: List[datetime], busy_ends: List[datetime], start_date: datetime, end_date: datetime, duration_minutes: int) -> List[Slot]:
+        """Walk 30-minute candidates against merged busy intervals"""
         free_slots = []
         current = start_date.replace(hour=9, minute=0, second=0, microsecond=0)
         
         while current < end_date:
             if current.weekday() < 5 and 9 <= current.hour < 17:
                 slot_end = current + timedelta(minutes=duration_minutes)
-                is_free = True
                 
-                for busy_start, busy_end in busy_times:
-                    if (current < busy_end and slot_end > busy_start):
-                        is_free = False
-                        break
-                
-                if is_free:
-                    free_slots.append({
-                        'start': current,
-                        'end': slot_end,
-                        'title': 'Available slot'
-                    })
+                # First merged interval still running after the slot starts;
+                # the slot is free unless that interval begins before it ends
+                i = bisect_right(busy_ends, current)
+                if i == len(busy_starts) or not slot_end > busy_starts[i]:
+                    free_slots.append(Slot.from_datetimes(current, slot_end))
             
             current += timedelta(minutes=30)
         
         return free_slots
     
+    @staticmethod
+    def _with_spacing(slots: List[Slot], busy_starts: List[datetime], busy_ends: List[datetime]) -> Iterator[Tuple[Slot, Optional[int]]]:
+        """Pair each free slot with the minutes to the nearest merged busy interval"""
+        end_minutes = [to_epoch_minute(end) for end in busy_ends]
+        start_minutes = [to_epoch_minute(start) for start in busy_starts]
+        for slot in slots:
+            gaps = []
+            before = bisect_right(end_minutes, slot.start_minute)
+            if before:
+                gaps.append(slot.start_minute - end_minutes[before - 1])
+            after = bisect_left(start_minutes, slot.end_minute)
+            if after < len(start_minutes):
+                gaps.append(start_minutes[after] - slot.end_minute)
+            yield slot, min(gaps, default=None)
+    
+    def _merge_busy_times(self, busy_times: List[Tuple[datetime, datetime]]) -> Tuple[List[datetime], List[datetime]]:
+        """Sort and merge overlapping busy intervals into parallel start/end lists"""
+        busy_starts: List[datetime] = []
+        busy_ends: List[datetime] = []
+        for start, end in sorted(busy_times):
+            # Only strictly overlapping intervals are merged: back-to-back events
+            # stay separate so zero-length slots behave exactly as before
+            if busy_ends and start < busy_ends[-1]:
+                if end > busy_ends[-1]:
+                    busy_ends[-1] = end
+            else:
+                busy_starts.append(start)
+                busy_ends.append(end)
+        return busy_starts, busy_ends
+    
     def book_appointment(self, start_time: datetime, end_time: datetime, title: str, description: str = "") -> bool:
         """Book an appointment"""
         if not self.service:
@@ -117,21 +371,77 @@ class CalendarService:
             return True
         
         try:
-            event = {
-                'summary': title,
-                'description': description,
-                'start': {
-                    'dateTime': start_time.isoformat(),
-                    'timeZone': 'UTC',
-                },
-                'end': {
-                    'dateTime': end_time.isoformat(),
-                    'timeZone': 'UTC',
-                },
-            }
-            
-            self.service.events().insert(calendarId=config.CALENDAR_ID, body=event).execute()
+            event = self._event_body(start_time, end_time, title, description)
+            created = self._execute(self.service.events().insert(calendarId=config.CALENDAR_ID, body=event))
+            if self.event_store is not None:
+                self.event_store.upsert(created)
+                self.event_store.invalidate()
             return True
         except Exception as e:
             print(f"Error booking appointment: {e}")
-            return False
\ No newline at end of file
+            FALLBACKS.inc(site='book_appointment')
+            return False
+    
+    async def abook_appointment(self, start_time: datetime, end_time: datetime, title: str, description: str = "") -> bool:
+        """Non-blocking book_appointment: the Google client runs on a worker thread"""
+        return await asyncio.to_thread(self.book_appointment, start_time, end_time, title, description)
+    
+    def _event_body(self, start_time: datetime, end_time: datetime, title: str, description: str = "") -> Dict:
+        """Insert body for a UTC event"""
+        return {
+            'summary': title,
+            'description': description,
+            'start': {
+                'dateTime': start_time.isoformat(),
+                'timeZone': 'UTC',
+            },
+            'end': {
+                'dateTime': end_time.isoformat(),
+                'timeZone': 'UTC',
+            },
+        }
+    
+    def book_appointments_bulk(self, bookings: List[Tuple[datetime, datetime, str, str]]) -> List[Dict]:
+        """Book many (start, end, title, description) appointments with batched insert requests.
+        
+        Returns one {'success', 'event_id', 'error'} dict per booking, in order.
+        The local event cache is updated and invalidated once for the whole batch.
+        """
+        if not self.service:
+            for start_time, end_time, title, _ in bookings:
+                print(f"Mock booking: {title} from {start_time} to {end_time}")
+            return [{'success': True, 'event_id': None, 'error': None} for _ in bookings]
+        
+        results: List[Optional[Dict]] = [None] * len(bookings)
+        created_events = []
+        
+        def on_response(request_id, response, exception):
+            index = int(request_id)
+            if exception is not None:
+                results[index] = {'success': False, 'event_id': None, 'error': str(exception)}
+            else:
+                results[index] = {'success': True, 'event_id': response.get('id'), 'error': None}
+                created_events.append(response)
+        
+        for i in range(0, len(bookings), self.BATCH_MAX_REQUESTS):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for index in range(i, min(i + self.BATCH_MAX_REQUESTS, len(bookings))):
+                batch.add(self.service.events().insert(calendarId=config.CALENDAR_ID, body=self._event_body(*bookings[index])),
+                          request_id=str(index))
+            try:
+                self._execute(batch)
+            except Exception as e:
+                print(f"Error booking appointments: {e}")
+                FALLBACKS.inc(site='book_appointments_bulk')
+                for index in range(i, min(i + self.BATCH_MAX_REQUESTS, len(bookings))):
+                    if results[index] is None:
+                        results[index] = {'success': False, 'event_id': None, 'error': str(e)}
+        
+        if self.event_store is not None and created_events:
+            self.event_store.upsert_many(created_events)
+            self.event_store.invalidate()
+        return results
+    
+    async def abook_appointments_bulk(self, bookings: List[Tuple[datetime, datetime, str, str]]) -> List[Dict]:
+        """Non-blocking book_appointments_bulk"""
+        return await asyncio.to_thread(self.book_appointments_bulk, bookings)
\ No newline at end of file
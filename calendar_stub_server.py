@@ -0,0 +1,139 @@
+"""
+Local stand-in for the Google Calendar API and OpenAI chat completions, for load tests
+
+Serves the events.list (including syncToken), events.insert and freeBusy
+endpoints CalendarService uses, backed by fakes.FakeCalendarService, plus an
+OpenAI-compatible /v1/chat/completions answered by fakes.FakeChatModel.
+
+Usage:
+    python calendar_stub_server.py --port 8090 --calendar-latency-ms 80 --llm-latency-ms 400 --error-rate 0.01
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:8090 OPENAI_BASE_URL=http://127.0.0.1:8090/v1 OPENAI_API_KEY=stub python api.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from fakes import FakeCalendarService, FakeChatModel, FakeHttpError, busy_calendar
+
+
+class StubSettings:
+    """Latency and failure injection, shared by every route"""
+
+    def __init__(self, calendar_latency_ms: float = 0, llm_latency_ms: float = 0,
+                 jitter_ms: float = 0, error_rate: float = 0.0):
+        self.calendar_latency_ms = calendar_latency_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+
+def _google_error(status: int, message: str, reason: str = "backendError") -> JSONResponse:
+    return JSONResponse(status_code=status, content={
+        'error': {'code': status, 'message': message, 'errors': [{'domain': 'global', 'reason': reason, 'message': message}]}
+    })
+
+
+def create_app(calendar: FakeCalendarService, settings: StubSettings) -> FastAPI:
+    app = FastAPI(title="Calendar and LLM stub")
+    model = FakeChatModel()
+    app.state.calendar = calendar
+    app.state.settings = settings
+
+    # Endpoints are async on purpose: everything runs on the event loop thread,
+    # so the fake calendar never sees concurrent mutation
+    @app.middleware("http")
+    async def inject_latency_and_errors(request: Request, call_next):
+        is_llm = request.url.path.startswith('/v1/')
+        latency_ms = settings.llm_latency_ms if is_llm else settings.calendar_latency_ms
+        if latency_ms or settings.jitter_ms:
+            await asyncio.sleep(max(0.0, latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000)
+        if settings.error_rate and random.random() < settings.error_rate:
+            if is_llm:
+                return JSONResponse(status_code=503, content={'error': {'message': "Injected failure", 'type': 'server_error'}})
+            return _google_error(503, "Injected failure")
+        return await call_next(request)
+
+    @app.get("/calendar/v3/calendars/{calendar_id}/events")
+    async def list_events(calendar_id: str, request: Request):
+        try:
+            return calendar._list_events(**dict(request.query_params, calendarId=calendar_id))
+        except FakeHttpError as e:
+            return _google_error(e.resp.status, str(e), 'fullSyncRequired' if e.resp.status == 410 else 'invalid')
+
+    @app.post("/calendar/v3/calendars/{calendar_id}/events")
+    async def insert_event(calendar_id: str, request: Request):
+        try:
+            return calendar._insert_event(calendar_id, await request.json())
+        except FakeHttpError as e:
+            return _google_error(e.resp.status, str(e), 'timeRangeEmpty')
+
+    @app.post("/calendar/v3/freeBusy")
+    async def query_freebusy(request: Request):
+        return calendar._query_freebusy(await request.json())
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        content = body['messages'][-1]['content']
+        prompt = content if isinstance(content, str) else ' '.join(part.get('text', '') for part in content)
+        message: Dict = {'role': 'assistant', 'content': None}
+        finish_reason = 'stop'
+        if body.get('tools') and 'Which slot number' not in prompt:
+            # Structured output through function calling: answer with the tool's arguments
+            function = body['tools'][0]['function']
+            properties = function.get('parameters', {}).get('properties', {})
+            arguments = {name: value for name, value in model.analyze(prompt).items() if name in properties}
+            message['tool_calls'] = [{
+                'id': f"call_{uuid.uuid4().hex[:24]}",
+                'type': 'function',
+                'function': {'name': function['name'], 'arguments': json.dumps(arguments)}
+            }]
+            finish_reason = 'tool_calls'
+        else:
+            message['content'] = model.reply_text(prompt)
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+            'usage': {'prompt_tokens': len(prompt.split()), 'completion_tokens': 8, 'total_tokens': len(prompt.split()) + 8}
+        }
+
+    @app.post("/stub/expire-sync-tokens")
+    async def expire_sync_tokens():
+        """Make clients' next incremental sync answer 410 Gone"""
+        calendar.expire_sync_tokens()
+        return {'status': 'expired'}
+
+    return app
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Local Google Calendar and OpenAI stand-in")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8090)
+    arg_parser.add_argument('--days', type=int, default=30, help="Days of seeded busy events, starting today")
+    arg_parser.add_argument('--events-per-day', type=int, default=6)
+    arg_parser.add_argument('--calendar-latency-ms', type=float, default=0)
+    arg_parser.add_argument('--llm-latency-ms', type=float, default=0)
+    arg_parser.add_argument('--jitter-ms', type=float, default=0)
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = arg_parser.parse_args()
+
+    calendar = busy_calendar(datetime.utcnow() - timedelta(days=1), args.days + 1, args.events_per_day)
+    settings = StubSettings(args.calendar_latency_ms, args.llm_latency_ms, args.jitter_ms, args.error_rate)
+    uvicorn.run(create_app(calendar, settings), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,58 @@
 import os
-from typing import Optional
+from typing import List, Optional
 
 class Config:
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL")
     GOOGLE_CALENDAR_CREDENTIALS_FILE: str = "credentials.json"
     GOOGLE_CALENDAR_TOKEN_FILE: str = "token.json"
     CALENDAR_ID: str = "primary"
+    # Comma-separated calendars that must also be free for an offered slot, read with one FreeBusy query
+    ATTENDEE_CALENDAR_IDS: List[str] = [calendar_id.strip() for calendar_id in os.getenv("ATTENDEE_CALENDAR_IDS", "").split(",") if calendar_id.strip()]
     SCOPES = ['https://www.googleapis.com/auth/calendar']
+    # Point at calendar_stub_server.py (e.g. http://127.0.0.1:8090) to run without Google
+    GOOGLE_API_ENDPOINT: Optional[str] = os.getenv("GOOGLE_API_ENDPOINT")
+    
+    # Local event cache settings
+    EVENT_CACHE_ENABLED: bool = os.getenv("EVENT_CACHE_ENABLED", "true").lower() == "true"
+    EVENT_CACHE_DB: Optional[str] = os.getenv("EVENT_CACHE_DB")
+    EVENT_SYNC_INTERVAL_SECONDS: int = int(os.getenv("EVENT_SYNC_INTERVAL_SECONDS", "30"))
     
     # FastAPI settings
     API_HOST: str = "127.0.0.1"
     API_PORT: int = 8000
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "1"))
+    
+    # Rule-based intent confidence needed to skip the LLM (above 1 disables the fast path)
+    INTENT_FAST_PATH_THRESHOLD: float = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.75"))
+    
+    # LLM intent cache (set INTENT_CACHE_PATH to persist it across restarts)
+    INTENT_CACHE_SIZE: int = int(os.getenv("INTENT_CACHE_SIZE", "1024"))
+    INTENT_CACHE_TTL_SECONDS: int = int(os.getenv("INTENT_CACHE_TTL_SECONDS", "3600"))
+    INTENT_CACHE_PATH: Optional[str] = os.getenv("INTENT_CACHE_PATH")
+    
+    # Conversation history: messages kept per session, and the size of the summary of older turns (0 disables it)
+    HISTORY_WINDOW: int = int(os.getenv("HISTORY_WINDOW", "20"))
+    HISTORY_SUMMARY_CHARS: int = int(os.getenv("HISTORY_SUMMARY_CHARS", "600"))
+    
+    # /chat worker pool (0 runs the async agent on the event loop instead)
+    CHAT_WORKER_THREADS: int = int(os.getenv("CHAT_WORKER_THREADS", "0"))
+    CHAT_QUEUE_SIZE: int = int(os.getenv("CHAT_QUEUE_SIZE", "64"))
+    CHAT_DEADLINE_SECONDS: float = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+    CHAT_BATCH_MAX_ITEMS: int = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "100"))
+    BOOK_BULK_MAX_ITEMS: int = int(os.getenv("BOOK_BULK_MAX_ITEMS", "500"))
+    
+    # /debug endpoints are disabled unless ADMIN_TOKEN is set; callers send it as X-Admin-Token
+    ADMIN_TOKEN: Optional[str] = os.getenv("ADMIN_TOKEN")
+    PROFILE_MAX_SECONDS: int = int(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    
+    # Session store ('memory', or 'sqlite' to share sessions across API workers)
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_DB_PATH: str = os.getenv("SESSION_DB_PATH", "sessions.db")
+    SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    SESSION_MAX_COUNT: int = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+    SESSION_MAX_BYTES: int = int(os.getenv("SESSION_MAX_BYTES", "262144"))
+    SESSION_SWEEP_INTERVAL_SECONDS: int = int(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
     
     # Streamlit settings
     STREAMLIT_HOST: str = "127.0.0.1"
@@ -0,0 +1,74 @@
+"""
+On-demand CPU stack sampling and allocation tracing for a running process
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Counter:
+    """Sample every thread's Python stack for ``seconds``, counting identical stacks.
+
+    Stacks are keyed root-first as "thread;file:function;..." strings, the
+    collapsed format flamegraph.pl and speedscope read. The sampling thread
+    leaves itself out, so it should run off the thread being diagnosed.
+    """
+    own_id = threading.get_ident()
+    names = {}
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if len(names) != threading.active_count():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            frames.append(names.get(thread_id, f"thread-{thread_id}").replace(' ', '_'))
+            stacks[';'.join(reversed(frames))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def format_collapsed(stacks: Counter) -> str:
+    """One "stack count" line per distinct stack, most frequent first"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def memory_snapshot(top: int = 20, frames: int = 1) -> Dict[str, Any]:
+    """Top allocation sites from tracemalloc, starting tracing on the first call.
+
+    Only allocations made after tracing starts are seen, so the first call
+    reports an empty list; call again once the process has done some work.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        return {'tracing': True, 'started_now': True, 'traced_bytes': 0, 'peak_bytes': 0, 'top': []}
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    current, peak = tracemalloc.get_traced_memory()
+    top_stats: List[Dict[str, Any]] = []
+    for stat in snapshot.statistics('traceback' if frames > 1 else 'lineno')[:top]:
+        top_stats.append({
+            'location': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            'size_bytes': stat.size,
+            'count': stat.count
+        })
+    return {'tracing': True, 'started_now': False, 'traced_bytes': current, 'peak_bytes': peak, 'top': top_stats}
+
+
+def stop_memory_tracing():
+    """Stop tracemalloc and release its bookkeeping"""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
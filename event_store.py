@@ -0,0 +1,184 @@
+"""
+Local calendar event cache kept fresh with incremental syncToken sync
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import FALLBACKS
+
+# Only what free-slot and sync logic read; full event bodies are much larger
+EVENT_FIELDS = 'items(id,status,start,end,transparency),nextPageToken,nextSyncToken'
+EVENTS_PAGE_SIZE = 250
+
+
+def _event_time_to_epoch(value: Dict) -> float:
+    """Convert an event start/end dict to a UTC epoch, treating naive times as UTC"""
+    parsed = datetime.fromisoformat(value.get('dateTime', value.get('date')).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _window_to_epoch(value: datetime) -> float:
+    """Convert a window bound to a UTC epoch, matching the 'Z' suffix used for timeMin/timeMax"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class EventStore:
+    """In-memory (optionally SQLite-backed) copy of one calendar's events.
+
+    The first sync downloads every event from ``prime_days`` ago onwards;
+    later syncs send the stored ``syncToken`` and only receive what changed.
+    Syncs are throttled to one per ``min_sync_interval`` seconds unless the
+    store has been invalidated, e.g. after a booking.
+    """
+
+    def __init__(self, service, calendar_id: str, db_path: Optional[str] = None,
+                 min_sync_interval: float = 30, prime_days: int = 1,
+                 execute: Optional[Callable] = None):
+        self.service = service
+        self._execute = execute or (lambda request: request.execute())
+        self.calendar_id = calendar_id
+        self.min_sync_interval = min_sync_interval
+        self.prime_days = prime_days
+        self._events: Dict[str, Dict] = {}
+        self._sync_token: Optional[str] = None
+        self._last_sync = 0.0
+        self._stale = True
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        """Open the SQLite backing file and load any previously synced events"""
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, start_ts REAL, end_ts REAL, body TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        for event_id, start_ts, end_ts, body in self._db.execute("SELECT id, start_ts, end_ts, body FROM events"):
+            self._events[event_id] = {'start_ts': start_ts, 'end_ts': end_ts, 'event': json.loads(body)}
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'sync_token'").fetchone()
+        self._sync_token = row[0] if row else None
+
+    def invalidate(self):
+        """Force the next read to sync with the server"""
+        self._stale = True
+
+    def sync(self, force: bool = False):
+        """Bring the local copy up to date, incrementally when a sync token is held.
+
+        Pages are fetched holding only the sync lock, so readers keep using the
+        current copy during the round trip; the data lock is taken just to
+        apply the changes and swap in the new sync token.
+        """
+        with self._sync_lock:
+            if not (force or self._stale or time.monotonic() - self._last_sync >= self.min_sync_interval):
+                return
+            # Cleared before fetching, so an invalidate() during the fetch forces another sync
+            self._stale = False
+            reset = False
+            try:
+                if self._sync_token:
+                    try:
+                        items, sync_token = self._fetch(syncToken=self._sync_token)
+                    except Exception as e:
+                        if getattr(getattr(e, 'resp', None), 'status', None) != 410:
+                            raise
+                        # Sync token expired - drop everything and start over
+                        FALLBACKS.inc(site='event_store_full_resync')
+                        items, sync_token = self._full_sync()
+                        reset = True
+                else:
+                    items, sync_token = self._full_sync()
+            except Exception:
+                self._stale = True
+                raise
+            with self._lock:
+                if reset:
+                    self._reset()
+                self._apply(items)
+                self._set_sync_token(sync_token)
+            self._last_sync = time.monotonic()
+
+    def _full_sync(self) -> Tuple[List[Dict], Optional[str]]:
+        time_min = datetime.now(timezone.utc) - timedelta(days=self.prime_days)
+        return self._fetch(timeMin=time_min.isoformat())
+
+    def _fetch(self, **params) -> Tuple[List[Dict], Optional[str]]:
+        """Page through events().list, returning every changed event and the next sync token"""
+        items = []
+        page_token = None
+        while True:
+            request_params = dict(params, calendarId=self.calendar_id, singleEvents=True,
+                                  fields=EVENT_FIELDS, maxResults=EVENTS_PAGE_SIZE)
+            if page_token:
+                request_params['pageToken'] = page_token
+            result = self._execute(self.service.events().list(**request_params))
+            items.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return items, result.get('nextSyncToken')
+
+    def _apply(self, items: List[Dict]):
+        removed = []
+        updated = []
+        for event in items:
+            event_id = event.get('id')
+            if not event_id:
+                continue
+            # Transparent events don't block time, so the store forgets them like cancelled ones
+            if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+                self._events.pop(event_id, None)
+                removed.append((event_id,))
+                continue
+            entry = {
+                'start_ts': _event_time_to_epoch(event['start']),
+                'end_ts': _event_time_to_epoch(event['end']),
+                'event': {'id': event_id, 'start': event['start'], 'end': event['end']}
+            }
+            self._events[event_id] = entry
+            updated.append((event_id, entry['start_ts'], entry['end_ts'], json.dumps(entry['event'])))
+        if self._db is not None and (removed or updated):
+            self._db.executemany("DELETE FROM events WHERE id = ?", removed)
+            self._db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)", updated)
+            self._db.commit()
+
+    def _set_sync_token(self, token: Optional[str]):
+        self._sync_token = token
+        if self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('sync_token', ?)", (token,))
+            self._db.commit()
+
+    def _reset(self):
+        self._events.clear()
+        self._sync_token = None
+        if self._db is not None:
+            self._db.execute("DELETE FROM events")
+            self._db.commit()
+
+    def upsert(self, event: Dict):
+        """Record an event we created ourselves so it is visible before the next sync"""
+        self.upsert_many([event])
+
+    def upsert_many(self, events: List[Dict]):
+        """Record several created events in one transaction"""
+        with self._lock:
+            self._apply(events)
+
+    def events_between(self, start_date: datetime, end_date: datetime) -> List[Dict]:
+        """Events overlapping the window, ordered by start time"""
+        window_start = _window_to_epoch(start_date)
+        window_end = _window_to_epoch(end_date)
+        with self._lock:
+            entries = [entry for entry in self._events.values()
+                       if entry['start_ts'] < window_end and entry['end_ts'] > window_start]
+        entries.sort(key=lambda entry: entry['start_ts'])
+        return [entry['event'] for entry in entries]
@@ -0,0 +1,96 @@
+"""
+Precompiled entity extraction for user messages
+"""
+import re
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# Patterns are listed in priority order: the first pattern that matches
+# anywhere wins, and its leftmost match is returned
+DATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'tomorrow',
+    r'today',
+    r'next week',
+    r'this week',
+    r'monday|tuesday|wednesday|thursday|friday|saturday|sunday',
+    r'\d{1,2}[/-]\d{1,2}',
+    r'next \w+day'
+]]
+
+TIME_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'\d{1,2}:\d{2}\s*(am|pm)?',
+    r'\d{1,2}\s*(am|pm)',
+    r'morning|afternoon|evening',
+    r'between\s+\d+.*\d+',
+    r'\d+-\d+\s*pm'
+]]
+
+DURATION_PATTERN = re.compile(r'\d+(?:\.\d+)?\s*-?\s*(?:hours?|hrs?|minutes?|mins?)')
+DURATION_PARTS = re.compile(r'(\d+(?:\.\d+)?)\s*-?\s*(hour|hr|min)')
+NAME_PATTERN = re.compile(r'(?:my name is|i\'m|call me)\s+([a-zA-Z]+)')
+NUMBER_PATTERN = re.compile(r'\d+')
+
+
+class Extraction(NamedTuple):
+    """Entities found in one message; spans index into the lowercased message"""
+    date: Optional[str]
+    time: Optional[str]
+    duration: Optional[str]
+    name: Optional[str]
+    slot_number: Optional[int]
+    spans: Dict[str, Tuple[int, int]]
+
+
+def _first_match(patterns, text: str):
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match
+    return None
+
+
+@lru_cache(maxsize=512)
+def extract_entities(text: str) -> Extraction:
+    """Extract date, time, duration, name and slot number from a message in one pass.
+
+    Every pattern runs at most once per message and results are memoized by
+    message text, so the intent, routing and slot-selection steps of a turn
+    share a single extraction. Callers must treat the result as read-only.
+    """
+    lowered = text.lower()
+    spans = {}
+
+    date_match = _first_match(DATE_PATTERNS, lowered)
+    time_match = _first_match(TIME_PATTERNS, lowered)
+    duration_match = DURATION_PATTERN.search(lowered)
+    number_match = NUMBER_PATTERN.search(lowered)
+    name_match = None
+    if 'my name is' in lowered or 'i\'m ' in lowered:
+        name_match = NAME_PATTERN.search(lowered)
+
+    for key, match in (('date', date_match), ('time', time_match), ('duration', duration_match),
+                       ('slot_number', number_match)):
+        if match:
+            spans[key] = match.span()
+    if name_match:
+        spans['name'] = name_match.span(1)
+
+    return Extraction(
+        date=date_match.group() if date_match else None,
+        time=time_match.group() if time_match else None,
+        duration=duration_match.group() if duration_match else None,
+        name=name_match.group(1).title() if name_match else None,
+        slot_number=int(number_match.group()) if number_match else None,
+        spans=spans
+    )
+
+
+def duration_minutes(text: str) -> Optional[int]:
+    """Whole minutes in a duration like '45 min', '2 hrs' or '1.5 hours', or None if it can't be read exactly"""
+    match = DURATION_PARTS.search(text.lower())
+    if not match:
+        return None
+    minutes = float(match.group(1)) * (1 if match.group(2) == 'min' else 60)
+    if minutes <= 0 or minutes != int(minutes):
+        return None
+    return int(minutes)
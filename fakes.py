@@ -0,0 +1,293 @@
+"""
+In-process stand-ins for the Google Calendar client and the chat model, for offline runs
+"""
+import asyncio
+import itertools
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage
+
+from extractors import extract_entities
+
+
+class FakeHttpError(Exception):
+    """Mimics googleapiclient.errors.HttpError closely enough for status checks"""
+
+    class _Response:
+        def __init__(self, status: int):
+            self.status = status
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or f"HTTP {status}")
+        self.resp = self._Response(status)
+
+
+class _FakeRequest:
+    def __init__(self, method_id: str, func, *args, **kwargs):
+        self.methodId = method_id
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    def execute(self, **kwargs):
+        return self._func(*self._args, **self._kwargs)
+
+
+class _FakeEvents:
+    def __init__(self, service: 'FakeCalendarService'):
+        self._service = service
+
+    def list(self, **params):
+        return _FakeRequest('calendar.events.list', self._service._list_events, **params)
+
+    def insert(self, calendarId: str, body: Dict):
+        return _FakeRequest('calendar.events.insert', self._service._insert_event, calendarId, body)
+
+
+class _FakeFreebusy:
+    def __init__(self, service: 'FakeCalendarService'):
+        self._service = service
+
+    def query(self, body: Dict):
+        return _FakeRequest('calendar.freebusy.query', self._service._query_freebusy, body)
+
+
+class _FakeBatch:
+    """Runs added requests in order, reporting each result or error to its callback"""
+
+    def __init__(self, service: 'FakeCalendarService', callback=None):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request: _FakeRequest, callback=None, request_id: Optional[str] = None):
+        self._requests.append((request, callback or self._callback, request_id or str(len(self._requests) + 1)))
+
+    def execute(self, **kwargs):
+        self._service.calls['batch'] += 1
+        for request, callback, request_id in self._requests:
+            try:
+                response, exception = request.execute(), None
+            except Exception as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class FakeCalendarService:
+    """Minimal ``build('calendar', 'v3')`` replacement backed by a list of events.
+
+    Every change bumps a version counter; sync tokens encode the version they
+    were issued at, so an incremental list returns exactly the events that
+    changed since then (deleted events come back with status 'cancelled').
+    Events belong to 'primary' unless added with another ``calendar_id``.
+    """
+
+    def __init__(self, events: Optional[List[Dict]] = None, page_size: int = 250):
+        self.page_size = page_size
+        self.calls: Dict[str, int] = {'list': 0, 'insert': 0, 'freebusy': 0, 'batch': 0}
+        self._version = 0
+        self._ids = itertools.count(1)
+        self._events: Dict[str, Dict] = {}
+        self._changed_at: Dict[str, int] = {}
+        self._calendar_of: Dict[str, str] = {}
+        self._min_valid_version = 0
+        for event in events or []:
+            self.add_event(event)
+
+    def events(self):
+        return _FakeEvents(self)
+
+    def freebusy(self):
+        return _FakeFreebusy(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+    def add_event(self, event: Dict, calendar_id: str = 'primary') -> Dict:
+        event = dict(event)
+        event.setdefault('id', f"evt{next(self._ids)}")
+        event.setdefault('status', 'confirmed')
+        self._calendar_of[event['id']] = calendar_id
+        self._touch(event)
+        return event
+
+    def add_busy(self, start: datetime, end: datetime, calendar_id: str = 'primary', **fields) -> Dict:
+        """Add a busy event between two naive UTC datetimes, written as RFC 3339 'Z' timestamps like Google's"""
+        return self.add_event(dict(fields, start={'dateTime': start.isoformat() + 'Z'},
+                                   end={'dateTime': end.isoformat() + 'Z'}), calendar_id)
+
+    def delete_event(self, event_id: str):
+        event = dict(self._events[event_id], status='cancelled')
+        self._touch(event)
+
+    def expire_sync_tokens(self):
+        """Make every previously issued sync token answer 410 Gone"""
+        self._min_valid_version = self._version + 1
+
+    def _touch(self, event: Dict):
+        self._version += 1
+        self._events[event['id']] = event
+        self._changed_at[event['id']] = self._version
+
+    def _calendar_events(self, calendar_id: str) -> List[Dict]:
+        return [event for event_id, event in self._events.items() if self._calendar_of[event_id] == calendar_id]
+
+    def _list_events(self, **params) -> Dict:
+        self.calls['list'] += 1
+        events = self._calendar_events(params.get('calendarId', 'primary'))
+        if params.get('syncToken'):
+            since = int(params['syncToken'].split('-')[1])
+            if since < self._min_valid_version:
+                raise FakeHttpError(410, "Sync token is no longer valid")
+            items = [event for event in events if self._changed_at[event['id']] > since]
+        else:
+            items = [event for event in events if event['status'] != 'cancelled']
+            if params.get('timeMin'):
+                time_min = self._parse(params['timeMin'])
+                items = [event for event in items if self._parse(self._when(event['end'])) > time_min]
+            if params.get('timeMax'):
+                time_max = self._parse(params['timeMax'])
+                items = [event for event in items if self._parse(self._when(event['start'])) < time_max]
+        items.sort(key=lambda event: self._parse(self._when(event['start'])))
+
+        page_size = min(int(params.get('maxResults', self.page_size)), self.page_size)
+        offset = int(params.get('pageToken') or 0)
+        result = {'items': items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+        else:
+            result['nextSyncToken'] = f"sync-{self._version}"
+        return result
+
+    def _insert_event(self, calendarId: str, body: Dict) -> Dict:
+        self.calls['insert'] += 1
+        if self._parse(self._when(body['end'])) <= self._parse(self._when(body['start'])):
+            raise FakeHttpError(400, "The specified time range is empty")
+        return self.add_event(body, calendarId)
+
+    def _query_freebusy(self, body: Dict) -> Dict:
+        """Busy intervals per calendar; transparent and cancelled events don't block time"""
+        self.calls['freebusy'] += 1
+        time_min = self._parse(body['timeMin'])
+        time_max = self._parse(body['timeMax'])
+        known = set(self._calendar_of.values()) | {'primary'}
+        calendars = {}
+        for item in body.get('items', []):
+            calendar_id = item['id']
+            if calendar_id not in known:
+                calendars[calendar_id] = {'busy': [], 'errors': [{'domain': 'global', 'reason': 'notFound'}]}
+                continue
+            busy = []
+            for event in self._calendar_events(calendar_id):
+                if event['status'] == 'cancelled' or event.get('transparency') == 'transparent':
+                    continue
+                start = self._parse(self._when(event['start']))
+                end = self._parse(self._when(event['end']))
+                if end > time_min and start < time_max:
+                    busy.append((max(start, time_min), min(end, time_max)))
+            calendars[calendar_id] = {'busy': [
+                {'start': start.isoformat() + 'Z', 'end': end.isoformat() + 'Z'} for start, end in sorted(busy)
+            ]}
+        return {'kind': 'calendar#freeBusy', 'timeMin': body['timeMin'], 'timeMax': body['timeMax'], 'calendars': calendars}
+
+    @staticmethod
+    def _when(value: Dict) -> str:
+        return value.get('dateTime', value.get('date'))
+
+    @staticmethod
+    def _parse(value: str) -> datetime:
+        """Parse to naive UTC so fake filtering never mixes naive and aware values"""
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+        return parsed
+
+
+def busy_calendar(start: datetime, days: int, events_per_day: int = 6) -> FakeCalendarService:
+    """Fake calendar with a deterministic spread of busy blocks on every day of a window"""
+    service = FakeCalendarService()
+    for day in range(days):
+        base = start.replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=day)
+        for n in range(events_per_day):
+            begin = base + timedelta(minutes=(n * 97) % 600)
+            service.add_busy(begin, begin + timedelta(minutes=30 + (n * 15) % 60))
+    return service
+
+
+_LATEST_MESSAGE = re.compile(r'(?:Latest message|User said): "(.*)"')
+_ORDINALS = {'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5}
+
+
+class FakeChatModel:
+    """Deterministic ChatOpenAI stand-in answering the agent's prompts from regex extraction.
+
+    Supports invoke/ainvoke/batch/abatch and with_structured_output, optionally
+    sleeping ``latency_seconds`` per call to mimic a model round-trip.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, schema=None):
+        self.latency_seconds = latency_seconds
+        self.schema = schema
+        self.calls = 0
+
+    def with_structured_output(self, schema, **kwargs) -> 'FakeChatModel':
+        return FakeChatModel(self.latency_seconds, schema)
+
+    def invoke(self, prompt: str):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt: str):
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self._answer(prompt)
+
+    def batch(self, prompts: List[str], return_exceptions: bool = False) -> List:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self._answer(prompt) for prompt in prompts]
+
+    async def abatch(self, prompts: List[str], return_exceptions: bool = False) -> List:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return [self._answer(prompt) for prompt in prompts]
+
+    def analyze(self, prompt: str) -> Dict:
+        """The intent fields this model reads from the latest message in a prompt"""
+        match = _LATEST_MESSAGE.search(prompt)
+        message = match.group(1) if match else prompt
+        entities = extract_entities(message)
+        lowered = message.lower()
+        slot_number = entities.slot_number or next((number for word, number in _ORDINALS.items() if word in lowered), 0)
+        if slot_number:
+            intent = 'select_slot'
+        elif any(word in lowered for word in ('yes', 'confirm', 'sure')):
+            intent = 'confirm'
+        elif any(word in lowered for word in ('available', 'free', 'slots')):
+            intent = 'check_availability'
+        else:
+            intent = 'book'
+        return {
+            'intent': intent, 'date': entities.date, 'time': entities.time, 'meeting_type': 'meeting',
+            'duration': entities.duration, 'urgency': 'normal', 'slot_number': slot_number
+        }
+
+    def reply_text(self, prompt: str) -> str:
+        """Plain-text answer: a slot number for slot prompts, otherwise the pipe-delimited intent"""
+        fields = self.analyze(prompt)
+        if 'Which slot number' in prompt:
+            return str(fields['slot_number'])
+        return '|'.join([fields['intent'], fields['date'] or 'none', fields['time'] or 'none',
+                         fields['meeting_type'], fields['duration'] or 'none', fields['urgency']])
+
+    def _answer(self, prompt: str):
+        self.calls += 1
+        if self.schema is not None and 'Which slot number' not in prompt:
+            fields = self.analyze(prompt)
+            return self.schema(**{name: value for name, value in fields.items() if name in self.schema.model_fields})
+        return AIMessage(content=self.reply_text(prompt))
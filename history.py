@@ -0,0 +1,90 @@
+"""
+Bounded conversation history with a rolling summary of older turns
+"""
+from typing import Iterable, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+
+class MessageWindow:
+    """Ring buffer holding the most recent ``capacity`` messages.
+
+    Appending to a full window overwrites the oldest slot in place and hands
+    the evicted message back, so memory and per-turn work stay flat however
+    long the conversation runs. Supports len(), iteration, negative indexes
+    and slices like the list it replaces in session state.
+    """
+
+    __slots__ = ('_items', '_head', '_size')
+
+    def __init__(self, capacity: int, messages: Iterable[BaseMessage] = ()):
+        self._items: List[Optional[BaseMessage]] = [None] * max(capacity, 1)
+        self._head = 0
+        self._size = 0
+        for message in messages:
+            self.append(message)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._items)
+
+    def append(self, message: BaseMessage) -> Optional[BaseMessage]:
+        """Add a message, returning the one it evicted when the window was full"""
+        capacity = len(self._items)
+        index = (self._head + self._size) % capacity
+        evicted = None
+        if self._size == capacity:
+            evicted = self._items[index]
+            self._head = (self._head + 1) % capacity
+        else:
+            self._size += 1
+        self._items[index] = message
+        return evicted
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[BaseMessage]:
+        capacity = len(self._items)
+        for offset in range(self._size):
+            yield self._items[(self._head + offset) % capacity]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(self._size))]
+        if key < 0:
+            key += self._size
+        if not 0 <= key < self._size:
+            raise IndexError("message index out of range")
+        return self._items[(self._head + key) % len(self._items)]
+
+    def __delitem__(self, key):
+        remaining = list(self)
+        del remaining[key]
+        self._items = [None] * len(self._items)
+        self._head = 0
+        self._size = 0
+        for message in remaining:
+            self.append(message)
+
+    def __repr__(self) -> str:
+        return f"MessageWindow(capacity={self.capacity}, size={self._size})"
+
+
+def summary_line(message: BaseMessage, max_chars: int = 120) -> str:
+    """One compact "Role: text" line for a message, keeping only its first line"""
+    role = "Assistant" if isinstance(message, AIMessage) else "User"
+    text = (message.content or '').strip().split('\n', 1)[0]
+    if len(text) > max_chars:
+        text = text[:max_chars - 3].rstrip() + '...'
+    return f"{role}: {text}"
+
+
+def roll_summary(summary: str, evicted: BaseMessage, max_chars: int) -> str:
+    """Fold an evicted message into the summary, dropping its oldest lines past max_chars"""
+    if max_chars <= 0:
+        return ''
+    summary = f"{summary}\n{summary_line(evicted)}" if summary else summary_line(evicted)
+    while len(summary) > max_chars and '\n' in summary:
+        summary = summary.split('\n', 1)[1]
+    return summary[-max_chars:]
@@ -0,0 +1,120 @@
+"""
+Memoizing cache for LLM intent extraction results
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s.!?,;]+$')
+
+
+def _normalize(text: str) -> str:
+    return _TRAILING_PUNCTUATION.sub('', _WHITESPACE.sub(' ', text.strip().lower()))
+
+
+class IntentCache:
+    """Bounded LRU cache with a TTL for parsed intent tuples.
+
+    Keys are hashes of the normalized latest message plus the normalized
+    conversation window sent to the model, so near-identical turns share an
+    entry. With ``path`` set, entries are loaded at startup and written back
+    every ``save_every`` insertions and at interpreter exit.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 path: Optional[str] = None, save_every: int = 50):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.save_every = save_every
+        self._entries: 'OrderedDict[str, Tuple[float, tuple]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def make_key(user_input: str, history: List[Tuple[str, str]]) -> str:
+        """Cache key for a message and its (role, content) history window"""
+        parts = [_normalize(user_input)] + [f"{role}:{_normalize(content)}" for role, content in history]
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def __contains__(self, key: str) -> bool:
+        """Whether a live entry exists, without counting a lookup or touching LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] >= time.time()
+
+    def put(self, key: str, fields: tuple):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, tuple(fields))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evicted'] += 1
+            self._unsaved += 1
+            save_now = self.path and self._unsaved >= self.save_every
+        if save_now:
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(
+                self.counters,
+                size=len(self._entries),
+                hit_rate=round(self.counters['hits'] / lookups, 3) if lookups else 0.0
+            )
+
+    def save(self):
+        """Write live entries to disk atomically"""
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            data = {key: [expires, list(fields)] for key, (expires, fields) in self._entries.items() if expires >= now}
+            self._unsaved = 0
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable intent cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, (expires, fields) in sorted(data.items(), key=lambda item: item[1][0]):
+            if expires >= now:
+                self._entries[key] = (expires, tuple(fields))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
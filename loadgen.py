@@ -0,0 +1,114 @@
+"""
+Load generator for the /chat endpoint
+
+Drives many concurrent sessions through short booking conversations and
+reports latency percentiles and throughput.
+
+Usage: python loadgen.py --url http://127.0.0.1:8000 --sessions 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+CONVERSATIONS = [
+    ["Hi, I'm Sam. Can you book a 30 minute call next week?", "2", "yes"],
+    ["What slots are available tomorrow morning?", "the first one please", "yes, book it"],
+    ["Schedule a meeting for next Monday afternoon", "3"],
+    ["Do you have any free time this Friday?", "1", "sure"],
+    ["Hmm, could you maybe find something around 4:30 pm?", "second"],
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.statuses: Counter = Counter()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, status: str, latency_ms: float):
+        self.statuses[status] += 1
+        if status == '200':
+            self.latencies_ms.append(latency_ms)
+
+    def summary(self) -> Dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        latencies = sorted(self.latencies_ms)
+        total = sum(self.statuses.values())
+        return {
+            'requests': total,
+            'ok': len(latencies),
+            'errors': total - len(latencies),
+            'statuses': dict(self.statuses),
+            'elapsed_s': round(elapsed, 2),
+            'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50), 1),
+            'p95_ms': round(percentile(latencies, 0.95), 1),
+            'p99_ms': round(percentile(latencies, 0.99), 1),
+            'max_ms': round(latencies[-1], 1) if latencies else 0.0
+        }
+
+
+async def run_session(client: httpx.AsyncClient, url: str, session_id: str, messages: List[str],
+                      limiter: asyncio.Semaphore, result: LoadResult):
+    """One conversation; a session's turns are sent in order, like a real user"""
+    for message in messages:
+        async with limiter:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/chat", json={'message': message, 'session_id': session_id})
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            result.record(status, (time.perf_counter() - start) * 1000)
+        if status != '200':
+            break
+
+
+async def run_load(url: str, sessions: int, concurrency: int, timeout: float) -> Dict:
+    limiter = asyncio.Semaphore(concurrency)
+    result = LoadResult()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        run_id = int(time.time())
+        await asyncio.gather(*(
+            run_session(client, url, f"load-{run_id}-{n}", CONVERSATIONS[n % len(CONVERSATIONS)], limiter, result)
+            for n in range(sessions)
+        ))
+    result.finished = time.perf_counter()
+    return result.summary()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Drive /chat with many concurrent sessions")
+    arg_parser.add_argument('--url', default='http://127.0.0.1:8000')
+    arg_parser.add_argument('--sessions', type=int, default=1000)
+    arg_parser.add_argument('--concurrency', type=int, default=100, help="Maximum requests in flight")
+    arg_parser.add_argument('--timeout', type=float, default=60.0)
+    arg_parser.add_argument('--output', help="Also write the summary to this JSON file")
+    args = arg_parser.parse_args()
+
+    summary = asyncio.run(run_load(args.url.rstrip('/'), args.sessions, args.concurrency, args.timeout))
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Bounded session state storage for the API
+"""
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import AIMessage, HumanMessage
+from config import config
+from history import roll_summary
+from slots import Slot
+
+# Rough per-object costs used by estimate_session_bytes
+MESSAGE_OVERHEAD_BYTES = 400
+SLOT_BYTES = 112
+MIN_MESSAGES_KEPT = 2
+
+
+def new_session_state() -> Dict:
+    """Initial state for a new conversation"""
+    return {
+        'messages': [],
+        'intent': None,
+        'date_preference': None,
+        'time_preference': None,
+        'duration': 60,
+        'available_slots': [],
+        'selected_slot': None,
+        'booking_confirmed': False,
+        'user_name': None,
+        'slot_choice': None,
+        'history_summary': '',
+        'last_reply': None
+    }
+
+
+def copy_session_state(state: Dict) -> Dict:
+    """A copy of a session's state that a turn can change without touching the stored one"""
+    copied = dict(state)
+    copied['messages'] = list(state.get('messages') or [])
+    copied['available_slots'] = list(state.get('available_slots') or [])
+    return copied
+
+
+def estimate_session_bytes(state: Dict) -> int:
+    """Approximate resident size of a session's state"""
+    size = 0
+    for message in state.get('messages') or []:
+        size += MESSAGE_OVERHEAD_BYTES + len(getattr(message, 'content', '') or '')
+    size += SLOT_BYTES * len(state.get('available_slots') or [])
+    size += len(state.get('history_summary') or '') + len(state.get('last_reply') or '')
+    return size
+
+
+def _encode_slot(slot: Optional[Slot]) -> Optional[List[int]]:
+    if not slot:
+        return None
+    return [slot.start_minute, slot.end_minute]
+
+
+def _decode_slot(value: Optional[List[int]]) -> Optional[Slot]:
+    if not value:
+        return None
+    return Slot(value[0], value[1])
+
+
+def encode_session(state: Dict) -> str:
+    """Serialize session state compactly: messages as role/content pairs, slots as epoch minutes"""
+    encoded = {key: value for key, value in state.items() if key not in ('messages', 'available_slots', 'selected_slot')}
+    encoded['messages'] = [
+        ['ai' if isinstance(message, AIMessage) else 'human', message.content]
+        for message in state.get('messages') or []
+    ]
+    encoded['available_slots'] = [_encode_slot(slot) for slot in state.get('available_slots') or []]
+    encoded['selected_slot'] = _encode_slot(state.get('selected_slot'))
+    return json.dumps(encoded, separators=(',', ':'))
+
+
+def decode_session(data: str) -> Dict:
+    """Inverse of encode_session"""
+    state = json.loads(data)
+    state['messages'] = [
+        AIMessage(content=content) if role == 'ai' else HumanMessage(content=content)
+        for role, content in state.get('messages') or []
+    ]
+    state['available_slots'] = [_decode_slot(slot) for slot in state.get('available_slots') or []]
+    state['selected_slot'] = _decode_slot(state.get('selected_slot'))
+    return state
+
+
+class SessionStore(ABC):
+    """Interface shared by the session backends.
+
+    Subclasses implement get/put/delete/sweep/stats/size_report; this base provides
+    get_or_create, the per-session byte budget and the background sweeper.
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int, max_session_bytes: int,
+                 sweep_interval: float = 60):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_session_bytes = max_session_bytes
+        self.sweep_interval = sweep_interval
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self.counters = {'evicted_ttl': 0, 'evicted_lru': 0, 'trimmed_messages': 0}
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Return a live session's state, or None if missing or expired"""
+
+    @abstractmethod
+    def put(self, session_id: str, state: Dict):
+        """Store a session's state, enforcing the size budget and session cap"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """Remove a session, returning whether it existed"""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Drop every expired session, returning how many were removed"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Session counts, limits and eviction counters"""
+
+    @abstractmethod
+    def size_report(self, top: int = 20) -> Dict[str, Any]:
+        """Total and largest session sizes, for memory diagnostics"""
+
+    def get_or_create(self, session_id: str) -> Dict:
+        state = self.get(session_id)
+        if state is None:
+            state = new_session_state()
+            self.put(session_id, state)
+        return state
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def start_sweeper(self):
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._stop.clear()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+    def _trim(self, state: Dict):
+        """Drop the oldest messages until the session fits its byte budget, folding them into the summary"""
+        messages = state.get('messages')
+        if not messages:
+            return
+        excess = estimate_session_bytes(state) - self.max_session_bytes
+        dropped = 0
+        while excess > 0 and len(messages) - dropped > MIN_MESSAGES_KEPT:
+            excess -= MESSAGE_OVERHEAD_BYTES + len(getattr(messages[dropped], 'content', '') or '')
+            dropped += 1
+        if dropped:
+            summary = state.get('history_summary') or ''
+            for message in messages[:dropped]:
+                summary = roll_summary(summary, message, config.HISTORY_SUMMARY_CHARS)
+            state['history_summary'] = summary
+            del messages[:dropped]
+            self.counters['trimmed_messages'] += dropped
+
+
+class MemorySessionStore(SessionStore):
+    """In-process session store with idle TTL, LRU eviction and a per-session size budget.
+
+    Sessions idle for longer than ``ttl_seconds`` expire, the least recently
+    used session is evicted once ``max_sessions`` are resident, and the oldest
+    messages of a session are dropped when it grows past ``max_session_bytes``.
+    A background thread sweeps expired sessions every ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int, max_session_bytes: int,
+                 sweep_interval: float = 60):
+        super().__init__(ttl_seconds, max_sessions, max_session_bytes, sweep_interval)
+        self._sessions: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Return a live session's state, or None if missing or expired"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            if self._expired(session_id, time.monotonic()):
+                self._remove(session_id)
+                self.counters['evicted_ttl'] += 1
+                return None
+            self._touch(session_id)
+            return state
+
+    def put(self, session_id: str, state: Dict):
+        """Store a session's state, enforcing the size budget and session cap"""
+        with self._lock:
+            self._trim(state)
+            self._sessions[session_id] = state
+            self._touch(session_id)
+            while len(self._sessions) > self.max_sessions:
+                oldest = next(iter(self._sessions))
+                self._remove(oldest)
+                self.counters['evicted_lru'] += 1
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def sweep(self) -> int:
+        """Drop every expired session, returning how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            # Sessions are kept in access order, so expired ones are at the front
+            expired = []
+            for session_id in self._sessions:
+                if not self._expired(session_id, now):
+                    break
+                expired.append(session_id)
+            for session_id in expired:
+                self._remove(session_id)
+            self.counters['evicted_ttl'] += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, resident_sessions=len(self._sessions))
+
+    def size_report(self, top: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            sizes = [(estimate_session_bytes(state), session_id, len(state.get('messages') or []))
+                     for session_id, state in self._sessions.items()]
+        sizes.sort(reverse=True)
+        return {
+            'measure': 'estimated_resident_bytes',
+            'sessions': len(sizes),
+            'total_bytes': sum(size for size, _, _ in sizes),
+            'largest': [{'session_id': session_id, 'bytes': size, 'messages': messages}
+                        for size, session_id, messages in sizes[:top]]
+        }
+
+    def _expired(self, session_id: str, now: float) -> bool:
+        return now - self._last_access[session_id] > self.ttl_seconds
+
+    def _touch(self, session_id: str):
+        self._sessions.move_to_end(session_id)
+        self._last_access[session_id] = time.monotonic()
+
+    def _remove(self, session_id: str):
+        del self._sessions[session_id]
+        del self._last_access[session_id]
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a SQLite database shared by every worker process.
+
+    The database runs in WAL mode so readers in one process don't block a
+    writer in another. States are stored in the compact encode_session form
+    and decoded on every get, so callers must put() their changes back.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_sessions: int, max_session_bytes: int,
+                 sweep_interval: float = 60):
+        super().__init__(ttl_seconds, max_sessions, max_session_bytes, sweep_interval)
+        self.db_path = db_path
+        self._local = threading.local()
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, last_access REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+        db.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.db_path, timeout=10)
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        db = self._connection()
+        row = db.execute("SELECT state, last_access FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > self.ttl_seconds:
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            db.commit()
+            self.counters['evicted_ttl'] += 1
+            return None
+        db.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (now, session_id))
+        db.commit()
+        return decode_session(row[0])
+
+    def put(self, session_id: str, state: Dict):
+        self._trim(state)
+        db = self._connection()
+        db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_id, encode_session(state), time.time()))
+        evicted = db.execute(
+            "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,)
+        ).rowcount
+        db.commit()
+        self.counters['evicted_lru'] += evicted
+
+    def delete(self, session_id: str) -> bool:
+        db = self._connection()
+        deleted = db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+        db.commit()
+        return deleted > 0
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def sweep(self) -> int:
+        db = self._connection()
+        expired = db.execute("DELETE FROM sessions WHERE last_access < ?", (time.time() - self.ttl_seconds,)).rowcount
+        db.commit()
+        self.counters['evicted_ttl'] += expired
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, resident_sessions=len(self))
+
+    def size_report(self, top: int = 20) -> Dict[str, Any]:
+        # Sessions live in the database, so report their encoded size there
+        db = self._connection()
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(state)), 0) FROM sessions").fetchone()
+        largest = db.execute("SELECT id, LENGTH(state) FROM sessions ORDER BY LENGTH(state) DESC LIMIT ?", (top,)).fetchall()
+        return {
+            'measure': 'encoded_bytes',
+            'sessions': count,
+            'total_bytes': total,
+            'largest': [{'session_id': session_id, 'bytes': size} for session_id, size in largest]
+        }
+
+
+def create_session_store(backend: str, db_path: str, **limits) -> SessionStore:
+    """Build the configured session backend ('memory' or 'sqlite')"""
+    if backend == 'sqlite':
+        return SQLiteSessionStore(db_path, **limits)
+    if backend == 'memory':
+        return MemorySessionStore(**limits)
+    raise ValueError(f"Unknown session backend: {backend}")
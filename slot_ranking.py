@@ -0,0 +1,107 @@
+"""
+Preference-aware top-k ranking of candidate free slots
+"""
+import heapq
+import re
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+from slots import Slot
+
+# Minute-of-day ranges for the named parts of the day
+DAY_PARTS = {
+    'morning': (9 * 60, 12 * 60),
+    'afternoon': (12 * 60, 17 * 60),
+    'evening': (17 * 60, 21 * 60),
+}
+
+# A slot with this much free time on both sides counts as fully spaced
+SPACING_CAP_MINUTES = 30
+# Penalty per day after the window start, so a later day must be a clearly better fit
+DAY_PENALTY_MINUTES = 60
+
+_MINUTES_PER_DAY = 24 * 60
+_TIME_RANGE = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*(?:-|to|and)\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?')
+_TIME_POINT = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)?')
+
+
+def _to_minute(hour: str, minute: Optional[str], meridiem: Optional[str]) -> int:
+    value = int(hour) % 24
+    if meridiem == 'pm' and value < 12:
+        value += 12
+    elif meridiem == 'am' and value == 12:
+        value = 0
+    elif meridiem is None and 1 <= value <= 7:
+        value += 12  # "at 3" during working hours means 3 pm
+    return value * 60 + int(minute or 0)
+
+
+def preferred_window(time_preference: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Minute-of-day range [start, end) a time preference asks for, or None if it names no time"""
+    if not time_preference:
+        return None
+    text = time_preference.lower()
+    for part, window in DAY_PARTS.items():
+        if part in text:
+            return window
+
+    match = _TIME_RANGE.search(text)
+    if match:
+        # "3-5 pm": the trailing meridiem applies to both ends
+        meridiem = match.group(6) or match.group(3)
+        start = _to_minute(match.group(1), match.group(2), match.group(3) or meridiem)
+        end = _to_minute(match.group(4), match.group(5), meridiem)
+        if end > start:
+            return start, end
+
+    match = _TIME_POINT.search(text)
+    if match:
+        minute = _to_minute(match.group(1), match.group(2), match.group(3))
+        return minute, minute + 1
+    return None
+
+
+def time_distance(slot: Slot, window: Optional[Tuple[int, int]]) -> int:
+    """Minutes between the slot's start time of day and the preferred window (0 inside it)"""
+    if window is None:
+        return 0
+    minute_of_day = slot.start_minute % _MINUTES_PER_DAY
+    if minute_of_day < window[0]:
+        return window[0] - minute_of_day
+    if minute_of_day >= window[1]:
+        return minute_of_day - window[1] + 1
+    return 0
+
+
+def rank_slots(candidates: Iterable[Tuple[Slot, Optional[int]]], k: int, origin_minute: int,
+               time_preference: Optional[str] = None, urgent: bool = False) -> List[Slot]:
+    """The k best slots from a stream of (slot, spacing) candidates, in time order.
+
+    ``spacing`` is the free time in minutes between the slot and its nearest
+    busy neighbour, or None when it has none. Candidates must arrive in time
+    order; only a k-sized heap is kept, so ranking a long window is O(n log k).
+    Urgent requests rank earliest first among slots matching the preferred
+    time of day; others trade off time-of-day fit, spacing from neighbouring
+    events and how many days after ``origin_minute`` the slot falls.
+    """
+    if k <= 0:
+        return []
+    window = preferred_window(time_preference)
+
+    if urgent:
+        if window is None:
+            # Already earliest first: stop reading candidates after k
+            return [slot for slot, _ in islice(candidates, k)]
+        top = heapq.nsmallest(k, candidates, key=lambda candidate: (time_distance(candidate[0], window),
+                                                                    candidate[0].start_minute))
+    else:
+        def penalty(candidate: Tuple[Slot, Optional[int]]) -> Tuple[float, int]:
+            slot, spacing = candidate
+            spacing = SPACING_CAP_MINUTES if spacing is None else min(spacing, SPACING_CAP_MINUTES)
+            days_out = (slot.start_minute - origin_minute) / _MINUTES_PER_DAY
+            score = time_distance(slot, window) + (SPACING_CAP_MINUTES - spacing) + DAY_PENALTY_MINUTES * max(days_out, 0)
+            return score, slot.start_minute
+
+        top = heapq.nsmallest(k, candidates, key=penalty)
+
+    return sorted((slot for slot, _ in top), key=lambda slot: slot.start_minute)
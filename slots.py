@@ -0,0 +1,54 @@
+"""
+Compact representation of a bookable calendar slot
+"""
+from datetime import datetime, timedelta
+
+# Slots use naive wall-clock datetimes, like the rest of the agent
+EPOCH = datetime(1970, 1, 1)
+_MINUTE = timedelta(minutes=1)
+
+
+def to_epoch_minute(value: datetime) -> int:
+    """Whole minutes from EPOCH to a naive datetime (seconds are dropped)"""
+    return (value - EPOCH) // _MINUTE
+
+
+class Slot:
+    """A free time range held as two ints: minutes since a naive epoch.
+
+    Slots sit in every session's ``available_slots``, so they keep no
+    datetimes of their own; ``start`` and ``end`` are computed on access.
+    """
+
+    __slots__ = ('start_minute', 'end_minute')
+
+    def __init__(self, start_minute: int, end_minute: int):
+        self.start_minute = start_minute
+        self.end_minute = end_minute
+
+    @classmethod
+    def from_datetimes(cls, start: datetime, end: datetime) -> 'Slot':
+        return cls(to_epoch_minute(start), to_epoch_minute(end))
+
+    @property
+    def start(self) -> datetime:
+        return EPOCH + timedelta(minutes=self.start_minute)
+
+    @property
+    def end(self) -> datetime:
+        return EPOCH + timedelta(minutes=self.end_minute)
+
+    @property
+    def duration_minutes(self) -> int:
+        return self.end_minute - self.start_minute
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Slot):
+            return NotImplemented
+        return self.start_minute == other.start_minute and self.end_minute == other.end_minute
+
+    def __hash__(self) -> int:
+        return hash((self.start_minute, self.end_minute))
+
+    def __repr__(self) -> str:
+        return f"Slot({self.start:%Y-%m-%d %H:%M} - {self.end:%H:%M})"
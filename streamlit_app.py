@@ -48,6 +48,33 @@ def send_message(message: str):
     except requests.exceptions.RequestException as e:
         return f"Connection error: {str(e)}"
 
+def stream_message(message: str, status):
+    """Stream the reply from the API, showing progress labels in the status placeholder"""
+    payload = {
+        "message": message,
+        "session_id": st.session_state.session_id
+    }
+    try:
+        with requests.post(f"{API_URL}/chat/stream", json=payload, stream=True, timeout=30) as response:
+            if response.status_code != 200:
+                yield f"Error: {response.status_code} - {response.text}"
+                return
+            
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "progress":
+                        status.caption(data["label"])
+                    elif event == "token":
+                        yield data["text"]
+                    elif event == "error":
+                        yield data["detail"]
+    except requests.exceptions.RequestException as e:
+        yield f"Connection error: {str(e)}"
+
 def main():
     initialize_session()
     
@@ -121,9 +148,9 @@ def main():
         
         # Get AI response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = send_message(prompt)
-            st.write(response)
+            status = st.empty()
+            response = st.write_stream(stream_message(prompt, status))
+            status.empty()
         
         # Add AI response to chat
         st.session_state.messages.append({"role": "assistant", "content": response})
@@ -3,6 +3,7 @@ import os
 from datetime import datetime, timedelta
 import uuid
 from agent import BookingAgent
+from session_store import new_session_state
 
 # Page config
 st.set_page_config(
@@ -11,26 +12,19 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_booking_agent() -> BookingAgent:
+    """One agent (calendar client, compiled graph, caches) shared by every browser session"""
+    return BookingAgent()
+
 def initialize_session():
     """Initialize session state"""
     if "session_id" not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
     if "messages" not in st.session_state:
         st.session_state.messages = []
-    if "booking_agent" not in st.session_state:
-        st.session_state.booking_agent = BookingAgent()
     if "session_state" not in st.session_state:
-        st.session_state.session_state = {
-            'messages': [],
-            'intent': None,
-            'date_preference': None,
-            'time_preference': None,
-            'duration': 60,
-            'available_slots': [],
-            'selected_slot': None,
-            'booking_confirmed': False,
-            'user_name': None
-        }
+        st.session_state.session_state = new_session_state()
 
 def main():
     initialize_session()
@@ -45,17 +39,7 @@ def main():
         
         if st.button("🗑️ Clear Chat"):
             st.session_state.messages = []
-            st.session_state.session_state = {
-                'messages': [],
-                'intent': None,
-                'date_preference': None,
-                'time_preference': None,
-                'duration': 60,
-                'available_slots': [],
-                'selected_slot': None,
-                'booking_confirmed': False,
-                'user_name': None
-            }
+            st.session_state.session_state = new_session_state()
             st.rerun()
         
         st.markdown("---")
@@ -94,7 +78,7 @@ def main():
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 try:
-                    response, updated_state = st.session_state.booking_agent.process_message(
+                    response, updated_state = get_booking_agent().process_message(
                         prompt, st.session_state.session_state
                     )
                     st.session_state.session_state = updated_state
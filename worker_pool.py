@@ -0,0 +1,113 @@
+"""
+Bounded thread pool with admission control for blocking request handlers
+"""
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolSaturated(Exception):
+    """Raised when the pool's queue is full and the request is shed"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Worker pool saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request does not finish within its deadline"""
+
+
+class BoundedWorkerPool:
+    """Runs blocking callables on a fixed set of threads behind a bounded queue.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    wait for a thread; anything beyond that is rejected immediately with
+    PoolSaturated instead of piling up. Work still queued when its deadline
+    passes is dropped without running.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, deadline_seconds: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.deadline_seconds = deadline_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-worker")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run func(*args) on the pool, waiting at most deadline_seconds"""
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated(self._retry_after())
+            self._queued += 1
+
+        submitted = time.monotonic()
+        future = self._executor.submit(self._call, submitted, func, args)
+        future.add_done_callback(self._on_cancelled)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.deadline_seconds)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise DeadlineExceeded(f"Request did not complete within {self.deadline_seconds}s")
+
+    def _call(self, submitted: float, func: Callable, args: tuple) -> Any:
+        started = time.monotonic()
+        waited = started - submitted
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        try:
+            if waited >= self.deadline_seconds:
+                raise DeadlineExceeded("Request expired while queued")
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._total_run += time.monotonic() - started
+
+    def _on_cancelled(self, future):
+        # Cancelled before a thread picked it up, so _call never ran
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        average_run = self._total_run / self._completed if self._completed else 1.0
+        backlog = self._queued + self._running
+        return max(1, math.ceil(average_run * backlog / self.max_workers))
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, wait times and rejections"""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self._queued,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'avg_wait_ms': round(self._total_wait / started * 1000, 2) if started else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 2)
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)